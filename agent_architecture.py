@@ -1,31 +1,81 @@
-import json
-import random
-from PIL import Image
-import io
+import atexit
+import os
+import threading
+import time
+from rule_matcher import RuleMatcher, StreamGuard
+from rule_set import get_rule_set
+from model_registry import registry
+from tool_cache import normalize_query, tool_cache, vitals_key
 
 # : Triad Architecture (Cognitive, Empathic, Ethical Engines)
 
+# --- Model loaders ---
+# Heavy libraries are imported inside the loaders so they are only paid for
+# when a model is first used (or warmed up), not at import time.
+
+def _load_risk_model():
+    # In a real app: import xgboost and load the pre-trained booster here.
+    from risk_model import LinearRiskModel
+    return LinearRiskModel()
+
+def _load_image_model():
+    # In a real app: import torch and load the CNN weights here.
+    from image_pipeline import MockLesionClassifier
+    return MockLesionClassifier()
+
+def _load_rag_index():
+    from rag import Retriever
+    return Retriever() # Memory-mapped vector index over knowledge_base/
+
+def _load_sentiment_model():
+    from sentiment import DistressModel
+    return DistressModel() # Hashed n-gram distress classifier
+
+for _name, _loader in (("risk_model", _load_risk_model),
+                       ("image_model", _load_image_model),
+                       ("rag_index", _load_rag_index),
+                       ("sentiment_model", _load_sentiment_model)):
+    if _name not in registry:
+        registry.register(_name, _loader)
+
 class CognitiveEngine:
     """
     , Page 10: Performs data-driven analysis, ML, and knowledge retrieval.
     """
     def __init__(self):
-        # In a real app, these would be loaded, pre-trained models.
-        self.risk_model = "mock_xgboost_model"
-        self.image_model = "mock_cnn_model"
-        self.rag_kb = "mock_vector_db_medquad_who"
+        # Models are loaded lazily from the shared registry on first use.
         print("Cognitive Engine Initialized.")
 
+    @property
+    def risk_model(self):
+        return registry.get("risk_model")
+
+    @property
+    def image_model(self):
+        return registry.get("image_model")
+
+    @property
+    def rag_kb(self):
+        return registry.get("rag_index")
+
     def run_rag(self, query: str) -> dict:
         """
         , Page 4: Evidence-Based Information Retrieval (RAG)
-        Simulates RAG from WHO Guidelines / MedQuAD.
+        Retrieves the best-matching passage from the WHO / MedQuAD-style corpus.
+        Results are cached per normalized query and index version.
         """
-        # Mock RAG response
-        if "hypertension" in query.lower():
+        retriever = self.rag_kb
+        result, hit = tool_cache.cached_call(
+            "rag_tool", retriever.version, normalize_query(query), lambda: self._retrieve(retriever, query)
+        )
+        return dict(result, cached=hit)
+
+    def _retrieve(self, retriever, query: str) -> dict:
+        results = retriever.search(query, k=1)
+        if results:
             return {
-                "content": "WHO recommends reducing sodium intake and engaging in 150 minutes of moderate aerobic exercise weekly for hypertension.",
-                "source": "WHO Guidelines, 2023",
+                "content": results[0]["text"],
+                "source": results[0]["source"],
                 "tool": "rag_tool"
             }
         return {
@@ -37,58 +87,148 @@ class CognitiveEngine:
     def run_risk_prediction(self, vitals: dict) -> dict:
         """
         , Page 4: Risk Prediction Models (trained on MIMIC-III)
-        Simulates a cardiovascular risk prediction.
+        Cardiovascular risk prediction for one set of vitals.
+        Thin wrapper over run_risk_prediction_batch, cached per vitals and model version.
         """
-        # Mock prediction logic
+        result, hit = tool_cache.cached_call(
+            "predict_risk_tool", self.risk_model.version, vitals_key(vitals), lambda: self._predict_risk(vitals)
+        )
+        return dict(result, cached=hit)
+
+    def _predict_risk(self, vitals: dict) -> dict:
+        from risk_model import FEATURES
+
         age = vitals.get("age", 50)
         bp = vitals.get("bp", "120/80")
-        
-        risk_score = random.uniform(5.0, 25.0)
-        risk_level = "High" if risk_score > 15 else "Moderate"
-        
+        result = self.run_risk_prediction_batch([{"age": age, "bp": bp}])
+        risk_score = float(result["risk_score"][0])
+        risk_level = "High" if result["high_risk"][0] else "Moderate"
+
         # , Page 4: Explainable AI (SHAP)
-        explanation = f"Your {risk_level} risk score ({risk_score:.1f}%) is primarily influenced by: Age ({age}) and Blood Pressure ({bp})."
+        labels = {"age": f"Age ({age})", "systolic": f"Blood Pressure ({bp})", "diastolic": f"Blood Pressure ({bp})"}
+        drivers = []
+        for index in result["top_features"][0]:
+            label = labels[FEATURES[index]]
+            if label not in drivers:
+                drivers.append(label)
+        explanation = f"Your {risk_level} risk score ({risk_score:.1f}%) is primarily influenced by: {' and '.join(drivers)}."
         
         return {
             "content": f"Based on the provided vitals, your 10-year cardiovascular risk score is {risk_score:.1f}% ({risk_level}).",
             "explanation": explanation,
+            "risk_score": risk_score,
             "tool": "predict_risk_tool"
         }
 
-    def run_image_analysis(self, image_bytes: bytes) -> dict:
+    def run_risk_prediction_batch(self, data, output_path: str = None, chunk_size: int = None, top_n: int = 2):
+        """
+        Scores many patients at once (e.g. nightly population screening).
+        `data` is a pandas DataFrame, an iterator of DataFrames, or an iterable
+        of vitals dicts. Scoring is vectorized and done chunk by chunk.
+
+        With output_path (.csv / .parquet), results are streamed to disk with
+        bounded memory and a summary is returned. Otherwise the per-row arrays
+        (risk_score, high_risk, contributions, top_features) are returned.
+        """
+        from risk_model import DEFAULT_CHUNK_SIZE, FEATURES, score_chunks, write_scores
+        import numpy as np
+
+        chunks = score_chunks(self.risk_model, data, chunk_size or DEFAULT_CHUNK_SIZE, top_n)
+        if output_path is not None:
+            rows = write_scores(chunks, output_path)
+            return {"rows": rows, "output_path": output_path, "tool": "predict_risk_tool"}
+
+        chunks = list(chunks)
+        if not chunks:
+            return {"features": FEATURES, "risk_score": np.zeros(0), "high_risk": np.zeros(0, dtype=bool),
+                    "contributions": np.zeros((0, len(FEATURES))), "top_features": np.zeros((0, top_n), dtype=int),
+                    "tool": "predict_risk_tool"}
+        return {
+            "features": FEATURES,
+            "risk_score": np.concatenate([c["risk_score"] for c in chunks]),
+            "high_risk": np.concatenate([c["high_risk"] for c in chunks]),
+            "contributions": np.concatenate([c["contributions"] for c in chunks]),
+            "top_features": np.concatenate([c["top_features"] for c in chunks]),
+            "tool": "predict_risk_tool"
+        }
+
+    IMAGE_CLASSES = [
+        ("Benign (e.g., nevus)",
+         "The analysis suggests this is a benign lesion, with high confidence."),
+        ("Suspicious (e.g., atypical nevus)",
+         "The analysis indicates features that are suspicious. Recommend dermatologist consultation."),
+        ("Concerning (e.g., melanoma)",
+         "The analysis has flagged features highly consistent with malignancy. Urgent dermatologist consultation is recommended."),
+    ]
+
+    def run_image_analysis(self, image) -> dict:
         """
         , Page 4: Medical Image Analysis (skin lesions)
         Simulates a CNN model.
+        `image` is either the raw upload bytes or a preprocessed
+        (224, 224, 3) uint8 array from image_pipeline.
         """
-        try:
-            # Try to open the image to verify it's valid
-            Image.open(io.BytesIO(image_bytes))
-            
-            # Mock analysis logic
-            class_idx = random.choice([0, 1, 2]) # 0: Benign, 1: Suspicious, 2: Concerning
-            
-            if class_idx == 0:
-                result = "Benign (e.g., nevus)"
-                explanation = "The analysis suggests this is a benign lesion, with high confidence."
-            elif class_idx == 1:
-                result = "Suspicious (e.g., atypical nevus)"
-                explanation = "The analysis indicates features that are suspicious. Recommend dermatologist consultation."
-            else:
-                result = "Concerning (e.g., melanoma)"
-                explanation = "The analysis has flagged features highly consistent with malignancy. Urgent dermatologist consultation is recommended."
+        return self.run_image_analysis_batch([image])[0]
 
-            return {
+    def run_image_analysis_batch(self, images) -> list:
+        """
+        Analyzes several images in one model call. `images` is a list of raw
+        upload bytes / preprocessed arrays, or an (n, 224, 224, 3) uint8 batch.
+        Returns one result dict per image, in order. Results are cached by
+        image content hash; only uncached images reach the model.
+        """
+        from tool_cache import MISSING
+        from image_pipeline import content_hash
+
+        version = self.image_model.version
+        keys = [content_hash(bytes(image) if isinstance(image, (bytes, bytearray)) else image.tobytes())
+                for image in images]
+        results = [tool_cache.get("analyze_image_tool", version, key) for key in keys]
+        misses = [i for i, result in enumerate(results) if result is MISSING]
+        if misses:
+            computed = self._analyze_images([images[i] for i in misses])
+            for i, result in zip(misses, computed):
+                tool_cache.put("analyze_image_tool", version, keys[i], result)
+                results[i] = result
+        return [dict(result, cached=i not in misses) for i, result in enumerate(results)]
+
+    def _analyze_images(self, images) -> list:
+        import numpy as np
+        from image_pipeline import MODEL_INPUT_SIZE, preprocess_batch
+
+        model = self.image_model
+        errors = [None] * len(images)
+        if isinstance(images, np.ndarray):
+            batch = images
+        elif all(isinstance(image, (bytes, bytearray)) for image in images):
+            # Header-validated, reduced-resolution decode straight to the model input size
+            batch, _, errors = preprocess_batch(images)
+        else:
+            batch = np.zeros((len(images), MODEL_INPUT_SIZE, MODEL_INPUT_SIZE, 3), dtype=np.uint8)
+            for i, image in enumerate(images):
+                if isinstance(image, np.ndarray):
+                    batch[i] = image
+                else:
+                    decoded, _, decode_errors = preprocess_batch([image])
+                    batch[i], errors[i] = decoded[0], decode_errors[0]
+
+        results = []
+        classes = model.predict(batch) if len(batch) else []
+        for class_idx, error in zip(classes, errors): # 0: Benign, 1: Suspicious, 2: Concerning
+            if error is not None:
+                results.append({
+                    "content": "Image analysis failed. The uploaded file may be corrupt or in an unsupported format.",
+                    "explanation": f"Error: {error}",
+                    "tool": "analyze_image_tool"
+                })
+                continue
+            result, explanation = self.IMAGE_CLASSES[int(class_idx)]
+            results.append({
                 "content": f"Image analysis result: {result}.",
                 "explanation": explanation,
                 "tool": "analyze_image_tool"
-            }
-            
-        except Exception as e:
-            return {
-                "content": "Image analysis failed. The uploaded file may be corrupt or in an unsupported format.",
-                "explanation": f"Error: {e}",
-                "tool": "analyze_image_tool"
-            }
+            })
+        return results
 
 class EmpathicEngine:
     """
@@ -97,8 +237,25 @@ class EmpathicEngine:
     system prompt, but it provides helper functions.
     """
     def __init__(self):
+        # Running distress estimate per chat session (updated one message at a time),
+        # created on first use: sentiment.py imports NumPy.
+        self._distress_tracker = None
+        self._tracker_lock = threading.Lock()
         print("Empathic Engine Initialized.")
 
+    @property
+    def distress_tracker(self):
+        if self._distress_tracker is None:
+            with self._tracker_lock:
+                if self._distress_tracker is None:
+                    from sentiment import DistressTracker
+                    self._distress_tracker = DistressTracker()
+        return self._distress_tracker
+
+    @property
+    def sentiment_model(self):
+        return registry.get("sentiment_model")
+
     def get_system_prompt(self):
         """
         Sets the agent's persona, multilingual capabilities, and empathy.
@@ -119,61 +276,138 @@ class EmpathicEngine:
     def detect_sentiment(self, query: str) -> dict:
         """
         , Page 5: Sentiment Analysis
-        Simulates sentiment detection for escalation.
+        Distress probability of one message ("High Distress", "Elevated" or "Neutral").
+        """
+        from sentiment import distress_status
+        score = float(self.sentiment_model.score([query])[0])
+        return {"status": distress_status(score), "score": round(score, 3)}
+
+    def detect_sentiment_batch(self, messages: list):
+        """
+        Scores many messages in one vectorized call (e.g. analytics over stored
+        conversations). Returns a NumPy array of distress probabilities;
+        sentiment.distress_status maps a score to its label.
+        """
+        return self.sentiment_model.score(list(messages))
+
+    def track_sentiment(self, session_id: str, query: str) -> dict:
+        """
+        Scores only the new message and folds it into the session's running
+        distress estimate, instead of re-scoring the whole history each turn.
         """
-        query_lower = query.lower()
-        if "scared" in query_lower or "anxious" in query_lower or "terrified" in query_lower:
-            return {"status": "High Distress", "score": 0.9}
-        return {"status": "Neutral", "score": 0.5}
+        score = float(self.sentiment_model.score([query])[0])
+        return self.distress_tracker.update(session_id, score)
 
 class EthicalEngine:
     """
     , Page 11: Implements rule-based oversight and HITL workflow.
     This is the core orchestrator.
     """
-    def __init__(self, rules_file: str = "rules.json"):
+    HIT_FLUSH_SECONDS = 10.0
+
+    def __init__(self, rules_file: str = "rules.json", record_hits: bool = True):
         self.rules_file = rules_file
-        self.rules = self.load_rules()
-        print(f"Ethical Engine Initialized with {len(self.rules)} rules.")
+        # Shared, versioned rule set: every engine, session and page sees the
+        # same compiled rules, and edits to rules.json are picked up on their own.
+        self.rule_set = get_rule_set(rules_file)
+        # Rule hit counters feed rule retirement in the Level 4 loop.
+        # Offline tools (e.g. replay_rules.py) turn this off.
+        self.record_hits = record_hits
+        self._flusher_pid = None # Process that runs the hit flusher (threads do not survive fork)
+        self._flusher_lock = threading.Lock()
+        print(f"Ethical Engine Initialized with {len(self.rules)} rules (version {self.rule_set.current().version}).")
+
+    @property
+    def rules(self) -> list:
+        return self.rule_set.current().rules
+
+    @property
+    def matcher(self) -> RuleMatcher:
+        return self.rule_set.current().matcher
 
     def load_rules(self):
-        try:
-            with open(self.rules_file, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            print("Warning: rules.json not found or is corrupt. Using empty rule list.")
-            return [] # Return empty list on error
+        """
+        Re-reads rules.json now. Each version is compiled into a single
+        RuleMatcher once, so validation cost no longer grows with the number of rules.
+        """
+        return self.rule_set.reload().rules
             
     def reload_rules(self):
         """
         Called by the Level 4 loop to load new rules.
         """
-        self.rules = self.load_rules()
-        print(f"Ethical Engine rules reloaded. Now at {len(self.rules)} rules.")
+        snapshot = self.rule_set.reload()
+        print(f"Ethical Engine rules reloaded. Now at {len(snapshot.rules)} rules (version {snapshot.version}).")
+
+    def _ensure_hit_flusher(self):
+        """
+        Starts a daemon thread (once per process) that writes the hit counters
+        every HIT_FLUSH_SECONDS, so idle sessions and workers do not sit on
+        their last hits, and flushes once more at interpreter exit.
+        """
+        if self._flusher_pid == os.getpid():
+            return
+        with self._flusher_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+
+            def _loop():
+                while True:
+                    time.sleep(self.HIT_FLUSH_SECONDS)
+                    self.flush_hits()
+
+            threading.Thread(target=_loop, name="rule-hit-flusher", daemon=True).start()
+            atexit.register(self.flush_hits)
+
+    def flush_hits(self):
+        """Writes the rule hits counted so far to the escalation store."""
+        hits = self.rule_set.drain_hits()
+        if not hits:
+            return
+        import utils
+        try:
+            utils.get_store().record_rule_hits(hits)
+        except Exception as e:
+            print(f"Warning: could not record rule hits: {e}")
+
+    def rule_verdict(self, rule: dict, subject: str = "Query") -> dict:
+        """Turns a matched rule into the validation result for its action."""
+        if self.record_hits and rule.get("id"):
+            self.rule_set.record_hit(rule["id"])
+            self._ensure_hit_flusher()
+        if rule["action"] == "escalate":
+            return {
+                "status": "FLAGGED",
+                "reason": f"{subject} matched escalation rule: '{rule['pattern']}'",
+                "message": rule["message"],
+                "rule_id": rule["id"]
+            }
+        return {
+            "status": "APPROVED_OVERRIDE",
+            "reason": f"{subject} matched block rule: '{rule['pattern']}'",
+            "message": rule["message"],
+            "rule_id": rule["id"]
+        }
+
+    def stream_guard(self) -> StreamGuard:
+        """
+        Rolling-window check for a response that is streamed chunk by chunk.
+        The same rules are applied to the outgoing text; a hit stops the stream.
+        """
+        return StreamGuard(self.matcher)
 
     def validate_response(self, user_query: str, draft_response: str) -> dict:
         """
         , Page 11, Figure 3: The core "Ethical Check".
         Checks a draft response against the loaded rules.
+        The query is scanned once; if several rules match, escalation rules
+        take priority over block rules, then file order (see RuleMatcher).
         """
-        user_query_lower = user_query.lower()
-        
-        for rule in self.rules:
-            if rule["pattern"] in user_query_lower:
-                if rule["action"] == "escalate":
-                    return {
-                        "status": "FLAGGED",
-                        "reason": f"Query matched escalation rule: '{rule['pattern']}'",
-                        "message": rule["message"],
-                        "rule_id": rule["id"]
-                    }
-                if rule["action"] == "block":
-                    return {
-                        "status": "APPROVED_OVERRIDE",
-                        "reason": f"Query matched block rule: '{rule['pattern']}'",
-                        "message": rule["message"],
-                        "rule_id": rule["id"]
-                    }
+        # One snapshot per check, so a concurrent reload is never seen half-way
+        rule = self.rule_set.current().matcher.match(user_query)
+        if rule is not None:
+            return self.rule_verdict(rule)
         
         # , Page 5: Uncertainty Detection (mocked)
         # Simulate low confidence if a generic health query is made without specific tools.
@@ -189,3 +423,25 @@ class EthicalEngine:
             "status": "APPROVED",
             "reason": "Passed all ethical checks."
         }
+
+
+# --- Shared engine instances ---
+# One set of engines per process, shared by every Streamlit session and page.
+# The Ethical Engine depends on the rules file, so there is one per file
+# (keyed like get_rule_set); the Cognitive and Empathic Engines are shared.
+_triads = {}
+_triad_lock = threading.Lock()
+
+def get_triad(rules_file: str = "rules.json") -> dict:
+    """Returns the process-wide Cognitive / Empathic / Ethical engines for a rules file."""
+    key = os.path.abspath(rules_file)
+    with _triad_lock:
+        triad = _triads.get(key)
+        if triad is None:
+            shared = next(iter(_triads.values()), None)
+            triad = _triads[key] = {
+                "cognitive": shared["cognitive"] if shared else CognitiveEngine(),
+                "empathic": shared["empathic"] if shared else EmpathicEngine(),
+                "ethical": EthicalEngine(rules_file=rules_file)
+            }
+        return triad
@@ -0,0 +1,78 @@
+"""
+Benchmark: per-turn cost and memory of a long chat session.
+
+Run from the repository root:
+    python benchmarks/bench_conversation_state.py
+
+Simulates a 500-turn session (user + assistant message per turn) with its
+scratch file and escalation store in a temporary directory. Each turn adds both messages, renders the visible
+window (serialized to text, standing in for st.markdown) and builds the
+draft context. The unbounded list the app used before is timed the same way
+for comparison. Per-turn time and memory should stay flat for
+ConversationState and grow linearly for the plain list.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversation_state import ConversationState
+from escalation_store import SQLiteEscalationStore
+
+TURNS = 500
+REPORT_AT = [10, 50, 100, 250, 500]
+ANSWER = ("Based on the provided vitals, your 10-year cardiovascular risk score is 19.0% (High). "
+          "**Explanation:** Your High risk score is primarily influenced by: Blood Pressure (150/95). ") * 3
+
+
+def render(messages) -> int:
+    return sum(len(f"{m['role']}: {m['content']}") for m in messages)
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    try:
+        store = SQLiteEscalationStore(os.path.join(tmp, "bench.db"))
+        state = ConversationState("bench-session", store=store, scratch_dir=tmp)
+        plain = []
+        print(f"{'turn':>6} {'state (us/turn)':>16} {'list (us/turn)':>15} {'state memory':>13} {'list memory':>12}")
+        window_times, list_times = [], []
+        for turn in range(1, TURNS + 1):
+            question = f"Question {turn}: what is my risk score and what does WHO recommend?"
+
+            start = time.perf_counter()
+            state.add("user", question)
+            state.add("assistant", ANSWER)
+            render(state.window)
+            state.context()
+            window_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            plain.append({"role": "user", "content": question})
+            plain.append({"role": "assistant", "content": ANSWER})
+            render(plain)
+            list(plain)
+            list_times.append(time.perf_counter() - start)
+
+            if turn in REPORT_AT:
+                recent = slice(max(turn - 10, 0), turn)
+                state_us = sum(window_times[recent]) / len(window_times[recent]) * 1e6
+                list_us = sum(list_times[recent]) / len(list_times[recent]) * 1e6
+                list_bytes = sum(sys.getsizeof(m) + sys.getsizeof(m["content"]) for m in plain)
+                print(f"{turn:>6} {state_us:>16.0f} {list_us:>15.0f} {state.memory_bytes() / 1024:>11.1f}KB {list_bytes / 1024:>10.1f}KB")
+        print(f"\nScratch turns: {state.persisted_count} (window {len(state.window)}, "
+              f"paged in on demand: {len(state.load_earlier(20))} per page); "
+              f"in the escalation store: {store.get_turn_count('bench-session')}")
+        start = time.perf_counter()
+        state.persist()
+        print(f"Escalation: {store.get_turn_count('bench-session')} turns moved to the escalation store "
+              f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
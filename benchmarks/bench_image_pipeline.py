@@ -0,0 +1,68 @@
+"""
+Benchmark: image preprocessing throughput (images/second) by input resolution.
+
+Run from the repository root:
+    python benchmarks/bench_image_pipeline.py
+
+Compares a full decode + resize ("naive", what a plain Image.open pipeline
+does) with image_pipeline.preprocess_batch, which uses reduced JPEG decoding
+(Image.draft) and writes into a preallocated batch buffer.
+"""
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from image_pipeline import MODEL_INPUT_SIZE, preprocess_batch
+
+RESOLUTIONS = [(640, 480), (1920, 1080), (4032, 3024)]
+FORMATS = ["JPEG", "PNG"]
+BATCH = 16
+MIN_SECONDS = 1.0
+
+
+def synthetic_image(size, fmt) -> bytes:
+    rng = np.random.default_rng(0)
+    w, h = size
+    # Smooth gradient plus noise: compresses like a photo, not like a flat fill.
+    yy, xx = np.mgrid[0:h, 0:w]
+    base = np.stack([(xx * 255 // w), (yy * 255 // h), ((xx + yy) * 255 // (w + h))], axis=-1)
+    noise = rng.integers(0, 24, size=(h, w, 3))
+    img = Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+    buf = io.BytesIO()
+    img.save(buf, fmt, quality=90) if fmt == "JPEG" else img.save(buf, fmt)
+    return buf.getvalue()
+
+
+def naive(images):
+    return np.stack([
+        np.asarray(Image.open(io.BytesIO(b)).convert("RGB").resize((MODEL_INPUT_SIZE, MODEL_INPUT_SIZE)))
+        for b in images
+    ])
+
+
+def throughput(fn, images) -> float:
+    count, start = 0, time.perf_counter()
+    while time.perf_counter() - start < MIN_SECONDS:
+        fn(images)
+        count += len(images)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    print(f"{'format':>6} {'resolution':>11} {'naive_img/s':>12} {'pipeline_img/s':>15} {'speedup':>8}")
+    for fmt in FORMATS:
+        for size in RESOLUTIONS:
+            images = [synthetic_image(size, fmt)] * BATCH
+            base = throughput(naive, images)
+            fast = throughput(lambda batch: preprocess_batch(batch), images)
+            print(f"{fmt:>6} {size[0]:>5}x{size[1]:<5} {base:>12.1f} {fast:>15.1f} {fast / base:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
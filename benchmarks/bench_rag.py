@@ -0,0 +1,93 @@
+"""
+Benchmark: RAG query latency (p50/p99) vs. corpus size.
+
+Run from the repository root:
+    python benchmarks/bench_rag.py
+
+Builds synthetic corpora from the knowledge_base vocabulary, then times
+single-query exact search and (for the larger corpora) IVF search.
+Index build time is reported separately; a second load of the same index
+is memory-mapped and does not re-embed anything.
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag import CORPUS_DIR, HashingEmbedder, IVFIndex, Retriever, read_document, tokenize
+
+CHUNK_COUNTS = [1_000, 10_000, 50_000]
+QUERIES = [
+    "what does WHO recommend for hypertension",
+    "how much salt should adults eat per day",
+    "minutes of moderate physical activity per week",
+    "how to prevent type 2 diabetes",
+]
+ITERATIONS = 200
+
+
+def vocabulary() -> list:
+    words = []
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        words.extend(tokenize(read_document(os.path.join(CORPUS_DIR, name))[1]))
+    return words
+
+
+def write_corpus(directory: str, chunks: int, words: list):
+    rng = random.Random(7)
+    per_file = 1_000
+    for file_no in range(0, chunks, per_file):
+        with open(os.path.join(directory, f"doc_{file_no:07d}.txt"), "w") as f:
+            f.write(f"Source: Synthetic {file_no}\n\n")
+            for _ in range(min(per_file, chunks - file_no)):
+                f.write(" ".join(rng.choice(words) for _ in range(60)) + "\n\n")
+
+
+def percentiles(samples: list) -> tuple:
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def time_queries(search) -> tuple:
+    samples = []
+    for i in range(ITERATIONS):
+        t0 = time.perf_counter()
+        search(QUERIES[i % len(QUERIES)])
+        samples.append((time.perf_counter() - t0) * 1000)
+    return percentiles(samples)
+
+
+def main():
+    words = vocabulary()
+    print(f"{'chunks':>8} {'build_s':>8} {'load_ms':>8} {'exact_p50':>10} {'exact_p99':>10} {'ivf_p50':>8} {'ivf_p99':>8}")
+    for count in CHUNK_COUNTS:
+        workdir = tempfile.mkdtemp()
+        try:
+            corpus, index_dir = os.path.join(workdir, "corpus"), os.path.join(workdir, "index")
+            os.makedirs(corpus)
+            write_corpus(corpus, count, words)
+
+            t0 = time.perf_counter()
+            Retriever(corpus, index_dir, HashingEmbedder())
+            build_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            retriever = Retriever(corpus, index_dir, HashingEmbedder())  # Cold start from disk.
+            load_ms = (time.perf_counter() - t0) * 1000
+
+            index = retriever.index
+            index.ivf = None
+            exact = time_queries(lambda q: retriever.search(q, k=3))
+            index.ivf = IVFIndex.train(index.vectors)
+            approx = time_queries(lambda q: retriever.search(q, k=3))
+            print(f"{count:>8} {build_s:>8.1f} {load_ms:>8.1f} {exact[0]:>10.2f} {exact[1]:>10.2f} "
+                  f"{approx[0]:>8.2f} {approx[1]:>8.2f}")
+        finally:
+            shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark: rule growth and validation latency, naive append vs. Level 4 compaction.
+
+Run from the repository root:
+    python benchmarks/bench_rule_evolution.py
+
+Feeds the same stream of resolved low-confidence cases (many rephrasings of
+a few hundred topics) through two evolution strategies: appending one rule
+per case (the old behavior), and rule_evolution's dedup / generalize /
+merge step followed by compaction. Reports rule counts and per-query
+matching latency as the case count grows.
+"""
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rule_evolution import candidate_from_case, compact_rules, integrate_candidate, validation_latency_us
+
+CASE_COUNTS = [500, 2_000, 5_000]
+PREFIXES = ["can you tell me about", "what should i know about", "i need advice on", "please explain", ""]
+SUFFIXES = ["", "for adults", "for my father", "during winter", "after surgery"]
+
+
+def synthetic_topics(count: int) -> list:
+    rng = random.Random(11)
+    alphabet = "abcdefghijklmnopqrstuvwxyz"
+    return [" ".join("".join(rng.choice(alphabet) for _ in range(rng.randint(5, 9))) for _ in range(2))
+            for _ in range(count)]
+
+
+def synthetic_cases(count: int, topics: list) -> list:
+    rng = random.Random(5)
+    cases = []
+    for i in range(count):
+        query = f"{rng.choice(PREFIXES)} {rng.choice(topics)} {rng.choice(SUFFIXES)}".strip()
+        cases.append({"id": f"{i:08d}-case", "user_query": query, "supervisor_response": "Reviewed answer."})
+    return cases
+
+
+def main():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(root, "rules.json")) as f:
+        policy_rules = json.load(f)
+    topics = synthetic_topics(300)
+    now = datetime.now(timezone.utc)
+    print(f"{'cases':>7} {'naive rules':>12} {'naive us/q':>11} {'compact rules':>14} {'compact us/q':>13} {'evolve ms/case':>15}")
+    for count in CASE_COUNTS:
+        cases = synthetic_cases(count, topics)
+        naive = list(policy_rules)
+        for case in cases:
+            candidate = candidate_from_case(case, now.isoformat())
+            if candidate is not None:
+                naive.append(candidate)
+
+        compacted = [dict(rule) for rule in policy_rules]
+        start = time.perf_counter()
+        for case in cases:
+            candidate = candidate_from_case(case, now.isoformat())
+            if candidate is not None:
+                compacted, _ = integrate_candidate(compacted, candidate)
+        compacted, _ = compact_rules(compacted, hits={}, now=now)
+        per_case_ms = (time.perf_counter() - start) / count * 1000
+
+        queries = [case["user_query"] for case in cases[:20]]
+        print(f"{count:>7,} {len(naive):>12,} {validation_latency_us(naive, queries, 50):>11.1f} "
+              f"{len(compacted):>14,} {validation_latency_us(compacted, queries, 50):>13.1f} {per_case_ms:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark: EthicalEngine.validate_response latency vs. rule count.
+
+Run from the repository root:
+    python benchmarks/bench_rule_matcher.py
+
+Latency should stay flat from 4 rules up to 50k rules, because the rule
+list is compiled once into a single automaton instead of being scanned
+rule-by-rule for every query.
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent_architecture import EthicalEngine
+
+RULE_COUNTS = [4, 100, 1_000, 10_000, 50_000]
+QUERIES = [
+    "What does WHO recommend for hypertension and blood pressure control?",
+    "Can you diagnose the rash on my arm from this photo?",
+    "I have had severe chest pain since this morning and feel dizzy.",
+    "What is my 10-year cardiovascular risk score given my vitals?",
+]
+ITERATIONS = 2_000
+
+
+def synthetic_rules(count: int) -> list:
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rules.json")) as f:
+        rules = json.load(f)
+    rng = random.Random(42)
+    alphabet = "abcdefghijklmnopqrstuvwxyz"
+    while len(rules) < count:
+        words = ["".join(rng.choice(alphabet) for _ in range(rng.randint(4, 9))) for _ in range(2)]
+        rules.append({
+            "id": f"rule_bench_{len(rules):06d}",
+            "pattern": " ".join(words),
+            "action": rng.choice(["block", "escalate"]),
+            "message": "Synthetic benchmark rule.",
+            "source": "benchmark",
+        })
+    return rules[:count]
+
+
+def main():
+    print(f"{'rules':>8} {'compile_ms':>11} {'p50_us':>8} {'p99_us':>8}")
+    for count in RULE_COUNTS:
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump(synthetic_rules(count), f)
+            path = f.name
+        try:
+            start = time.perf_counter()
+            engine = EthicalEngine(rules_file=path, record_hits=False)
+            compile_ms = (time.perf_counter() - start) * 1000
+            samples = []
+            for i in range(ITERATIONS):
+                query = QUERIES[i % len(QUERIES)]
+                t0 = time.perf_counter()
+                engine.validate_response(query, "draft")
+                samples.append((time.perf_counter() - t0) * 1e6)
+            samples.sort()
+            p50 = samples[len(samples) // 2]
+            p99 = samples[int(len(samples) * 0.99)]
+            print(f"{count:>8} {compile_ms:>11.1f} {p50:>8.1f} {p99:>8.1f}")
+        finally:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
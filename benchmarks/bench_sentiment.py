@@ -0,0 +1,64 @@
+"""
+Benchmark: distress classifier throughput (messages/second).
+
+Run from the repository root:
+    python benchmarks/bench_sentiment.py
+
+Compares one detect_sentiment call per message with a single
+detect_sentiment_batch call over the same messages, and times the
+incremental per-session update used on each chat turn.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent_architecture import EmpathicEngine
+
+BATCH_SIZES = [1_000, 10_000, 100_000]
+TEMPLATES = [
+    "What does WHO recommend for hypertension?",
+    "I am really scared about my blood pressure readings",
+    "Thanks, that was helpful and I feel better now",
+    "My chest hurts and I'm not okay, please help me",
+    "How many minutes of exercise should I get each week?",
+    "I've been feeling anxious and overwhelmed since my diagnosis",
+]
+FILLER = "today yesterday morning again still really quite very my the and a little".split()
+
+
+def synthetic_messages(count: int) -> list:
+    rng = random.Random(7)
+    return [f"{rng.choice(TEMPLATES)} {' '.join(rng.sample(FILLER, 3))}" for _ in range(count)]
+
+
+def main():
+    engine = EmpathicEngine()
+    engine.detect_sentiment("warm up")
+    print(f"{'messages':>10} {'single (msg/s)':>16} {'batch (msg/s)':>15} {'speed-up':>9}")
+    for count in BATCH_SIZES:
+        messages = synthetic_messages(count)
+        single_count = min(count, 10_000) # The per-message loop is slow; sample it.
+        start = time.perf_counter()
+        for message in messages[:single_count]:
+            engine.detect_sentiment(message)
+        single_rate = single_count / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        engine.detect_sentiment_batch(messages)
+        batch_rate = count / (time.perf_counter() - start)
+        print(f"{count:>10,} {single_rate:>16,.0f} {batch_rate:>15,.0f} {batch_rate / single_rate:>8.1f}x")
+
+    messages = synthetic_messages(10_000)
+    start = time.perf_counter()
+    for i, message in enumerate(messages):
+        engine.track_sentiment(f"session-{i % 100}", message)
+    elapsed = time.perf_counter() - start
+    print(f"\nIncremental session updates: {len(messages) / elapsed:,.0f} turns/s "
+          f"({elapsed / len(messages) * 1e6:.0f} us per turn, independent of history length)")
+
+
+if __name__ == "__main__":
+    main()
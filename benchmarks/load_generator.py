@@ -0,0 +1,107 @@
+"""
+Load generator for the headless Triad server (server.py).
+
+Start the server first, then run from the repository root:
+    python server.py --workers 4
+    python benchmarks/load_generator.py --concurrency 32 --duration 20
+
+Each client thread keeps one HTTP/1.1 connection open and sends POST
+/v1/chat requests back to back, cycling through a mix of queries (risk,
+RAG, general and rule-blocked). Escalating queries are left out by default
+because every one of them writes a case to escalations.db; add them with
+--escalations.
+
+Reports requests per second, latency percentiles (p50/p90/p95/p99/max) and
+the count of each status and error.
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from collections import Counter
+
+QUERIES = [
+    {"query": "What is my cardiovascular risk score?", "vitals": {"age": 62, "bp": "150/95"}},
+    {"query": "What does WHO recommend for hypertension?"},
+    {"query": "How can I lower my blood pressure?"},
+    {"query": "Can you diagnose this rash?"},
+    {"query": "Check my vitals please", "vitals": {"age": 45, "bp": "128/84"}},
+]
+ESCALATING_QUERIES = [
+    {"query": "Tell me about healthy sleep habits"}, # Low confidence -> supervisor review
+    {"query": "I have severe chest pain"},
+]
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(int(round(q / 100.0 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def client(host: str, port: int, queries: list, deadline: float, offset: int, latencies: list, outcomes: Counter, lock):
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    local_latencies, local_outcomes = [], Counter()
+    i = offset
+    while time.perf_counter() < deadline:
+        body = json.dumps(queries[i % len(queries)])
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request("POST", "/v1/chat", body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            data = response.read()
+            elapsed = time.perf_counter() - start
+            if response.status == 200:
+                local_outcomes[json.loads(data)["status"]] += 1
+                local_latencies.append(elapsed)
+            else:
+                local_outcomes[f"HTTP {response.status}"] += 1
+        except Exception as e:
+            local_outcomes[type(e).__name__] += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+    conn.close()
+    with lock:
+        latencies.extend(local_latencies)
+        outcomes.update(local_outcomes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run.")
+    parser.add_argument("--escalations", action="store_true", help="Include queries that create escalation cases.")
+    args = parser.parse_args()
+
+    queries = QUERIES + (ESCALATING_QUERIES if args.escalations else [])
+    latencies, outcomes, lock = [], Counter(), threading.Lock()
+    start = time.perf_counter()
+    deadline = start + args.duration
+    threads = [
+        threading.Thread(target=client, args=(args.host, args.port, queries, deadline, n, latencies, outcomes, lock))
+        for n in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    total = sum(outcomes.values())
+    print(f"{total} requests in {elapsed:.1f}s with {args.concurrency} clients")
+    print(f"Throughput: {len(latencies) / elapsed:,.1f} req/s (successful)")
+    print("Latency (ms): " + "  ".join(
+        f"{name} {percentile(latencies, q) * 1000:.1f}"
+        for name, q in [("p50", 50), ("p90", 90), ("p95", 95), ("p99", 99), ("max", 100)]
+    ))
+    print("Outcomes: " + ", ".join(f"{name}={count}" for name, count in sorted(outcomes.items())))
+
+
+if __name__ == "__main__":
+    main()
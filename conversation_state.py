@@ -0,0 +1,202 @@
+import glob
+import os
+import re
+import sys
+import tempfile
+import time
+import weakref
+from collections import deque
+
+# , Page 5: Maintain dialogue state - bounded per-session conversation memory.
+#
+# A session keeps only a fixed window of recent messages in memory. When a
+# message leaves the window it is folded into a short rolling summary and
+# written (in small batches) to a per-session scratch SQLite file in the temp
+# directory, so adding a turn costs the same at turn 5 and at turn 500.
+# Key facts (latest vitals, flagged topics, distress peak) are kept alongside;
+# context() hands summary, facts and window to the draft step.
+# Older turns are paged back in from the scratch file on demand.
+#
+# Chats are only kept on disk for as long as needed: the scratch file is
+# deleted when the session ends (its state is garbage collected), and
+# scratch files orphaned by a crash are purged after SCRATCH_MAX_AGE_SECONDS.
+# Only when the session escalates (persist()) is the transcript copied to the
+# escalation store's message tables (see escalation_store.py), where the case
+# references it; later turns of that session then go there directly.
+
+DEFAULT_WINDOW = 20 # messages (10 user/assistant exchanges)
+PERSIST_BATCH = 10 # Evicted messages are written in batches of this size (one commit)
+SUMMARY_LINES = 12
+SNIPPET_CHARS = 90
+MAX_FLAGGED_TOPICS = 20
+SCRATCH_DIR = os.path.join(tempfile.gettempdir(), "triad-conversations")
+SCRATCH_MAX_AGE_SECONDS = 24 * 3600
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s")
+_MARKDOWN_RE = re.compile(r"[*_`#>]+")
+
+
+def _snippet(text: str) -> str:
+    """First sentence of a message, without markdown, capped in length."""
+    first = _SENTENCE_RE.split(_MARKDOWN_RE.sub("", text).strip(), 1)[0]
+    return first if len(first) <= SNIPPET_CHARS else first[:SNIPPET_CHARS - 1].rstrip() + "…"
+
+
+def _remove_scratch(path: str):
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+
+
+def purge_stale_scratch(max_age: float = SCRATCH_MAX_AGE_SECONDS, directory: str = SCRATCH_DIR) -> int:
+    """Deletes scratch files left behind by sessions that ended without cleanup (e.g. a crash)."""
+    removed = 0
+    cutoff = time.time() - max_age
+    for path in glob.glob(os.path.join(directory, "conversation-*.db")):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                _remove_scratch(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+class ConversationState:
+    def __init__(self, session_id: str, window: int = DEFAULT_WINDOW, store=None, scratch_dir: str = SCRATCH_DIR):
+        self.session_id = session_id
+        self.window = deque(maxlen=window)
+        self.turn_count = 0 # Messages in the whole conversation
+        self.persisted_count = 0 # Messages already written to the store
+        self.summarized_count = 0 # Messages folded into the summary
+        self.summary_lines = deque(maxlen=SUMMARY_LINES)
+        self._evicted = [] # Left the window, not yet written (at most PERSIST_BATCH)
+        self.facts = {"vitals": {}, "flagged_topics": [], "distress_peak": 0.0}
+        self.escalated = False # Once True, turns are written to the escalation store
+        self._store = store
+        self._scratch = None
+        self._scratch_dir = scratch_dir
+        self._scratch_cleanup = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            import utils
+            self._store = utils.get_store()
+        return self._store
+
+    @property
+    def turn_store(self):
+        """Where evicted turns go: the scratch file, or the escalation store after an escalation."""
+        if self.escalated:
+            return self.store
+        if self._scratch is None:
+            from escalation_store import SQLiteEscalationStore
+            os.makedirs(self._scratch_dir, exist_ok=True)
+            purge_stale_scratch(directory=self._scratch_dir)
+            fd, path = tempfile.mkstemp(prefix="conversation-", suffix=".db", dir=self._scratch_dir)
+            os.close(fd)
+            self._scratch = SQLiteEscalationStore(path)
+            self._scratch_cleanup = weakref.finalize(self, _remove_scratch, path)
+        return self._scratch
+
+    def _discard_scratch(self):
+        if self._scratch_cleanup is not None:
+            self._scratch_cleanup()
+        self._scratch = self._scratch_cleanup = None
+
+    @property
+    def window_start(self) -> int:
+        """Turn index of the oldest message still in memory."""
+        return self.turn_count - len(self.window)
+
+    def add(self, role: str, content: str) -> dict:
+        message = {"role": role, "content": content}
+        if len(self.window) == self.window.maxlen:
+            self._evict(self.window[0])
+        self.window.append(message)
+        self.turn_count += 1
+        return message
+
+    def _evict(self, message: dict):
+        if self.window_start >= self.persisted_count:
+            self._evicted.append(message)
+            if len(self._evicted) >= PERSIST_BATCH:
+                self._flush_evicted()
+        prefix = "User asked" if message["role"] == "user" else "Assistant answered"
+        self.summary_lines.append(f"{prefix}: {_snippet(message['content'])}")
+        self.summarized_count += 1
+
+    def _flush_evicted(self):
+        if self._evicted:
+            self.persisted_count = self.turn_store.append_turns(
+                self.session_id, self._evicted, start_index=self.persisted_count, base_index=self.persisted_count
+            )
+            self._evicted = []
+
+    def persist(self) -> int:
+        """
+        Before an escalation: moves the session's transcript into the escalation
+        store (scratch turns, then the window) and returns the turn count.
+        """
+        self._flush_evicted()
+        if not self.escalated:
+            if self._scratch is not None and self.persisted_count:
+                self.store.append_turns(self.session_id, self._scratch.get_turns(self.session_id, 0, self.persisted_count),
+                                        start_index=0, base_index=0)
+            self.escalated = True
+            self._discard_scratch()
+        if self.persisted_count < self.turn_count:
+            self.persisted_count = self.store.append_turns(
+                self.session_id, list(self.window), start_index=self.persisted_count, base_index=self.window_start
+            )
+        return self.persisted_count
+
+    def update_facts(self, vitals: dict = None, sentiment: dict = None, validation: dict = None, query: str = None):
+        if vitals:
+            self.facts["vitals"] = dict(vitals)
+        if sentiment:
+            self.facts["distress_peak"] = max(self.facts["distress_peak"], sentiment.get("peak", sentiment.get("score", 0.0)))
+        if validation and validation.get("status") != "APPROVED":
+            topics = self.facts["flagged_topics"]
+            topics.append({"turn": self.turn_count, "status": validation["status"],
+                           "rule_id": validation.get("rule_id"), "query": _snippet(query or "")})
+            del topics[:-MAX_FLAGGED_TOPICS]
+
+    def summary(self) -> str:
+        if not self.summarized_count:
+            return ""
+        omitted = self.summarized_count - len(self.summary_lines)
+        header = f"Earlier in this conversation ({self.summarized_count} messages"
+        header += f", {omitted} oldest omitted):" if omitted else "):"
+        return "\n".join([header] + [f"- {line}" for line in self.summary_lines])
+
+    def context(self) -> dict:
+        """What a draft step receives: rolling summary, key facts and the recent window."""
+        return {"summary": self.summary(), "facts": self.facts, "messages": list(self.window)}
+
+    def load_earlier(self, count: int, before: int = None) -> list:
+        """Pages in up to `count` stored turns before turn `before` (default: the window start)."""
+        self._flush_evicted()
+        end = self.window_start if before is None else before
+        return self.turn_store.get_turns(self.session_id, max(end - count, 0), end)
+
+    def memory_bytes(self) -> int:
+        """Approximate in-memory size of this session's state."""
+        size = sys.getsizeof(self.window) + sys.getsizeof(self.summary_lines)
+        size += sum(sys.getsizeof(m) + sys.getsizeof(m["content"]) for m in self.window)
+        size += sum(sys.getsizeof(m) + sys.getsizeof(m["content"]) for m in self._evicted)
+        size += sum(sys.getsizeof(line) for line in self.summary_lines)
+        size += sum(sys.getsizeof(t) + sys.getsizeof(t["query"]) for t in self.facts["flagged_topics"])
+        return size
+
+    def stats(self) -> dict:
+        return {
+            "turns": self.turn_count,
+            "in_window": len(self.window),
+            "persisted": self.persisted_count,
+            "summarized": self.summarized_count,
+            "memory_bytes": self.memory_bytes(),
+        }
@@ -0,0 +1,415 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+
+# : Storage for HITL escalations reviewed on the Supervisor Dashboard.
+#
+# Every escalation is a single indexed row, so adding or resolving a case costs
+# the same no matter how much history has accumulated, and concurrent Streamlit
+# sessions cannot overwrite each other's records.
+#
+# Conversation transcripts are stored once: each message is content-addressed
+# in `messages`, each session's turn order lives in `session_turns`, and an
+# escalation only references (session_id, turn_start, turn_end). A long session
+# that escalates several times no longer stores its transcript again each time.
+
+BUSY_TIMEOUT = 5.0 # Seconds a write waits for another connection's transaction
+MIGRATION_LOCK_TIMEOUT = 60.0 # Seconds a second process waits for a running legacy import
+_LEGACY_NAMESPACE = uuid.UUID("6f1c3d52-9a0e-4c57-8b7e-2d4f1a9c0e31")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def message_hash(message: dict) -> str:
+    """Content address of a chat message (role + content)."""
+    digest = hashlib.sha256()
+    digest.update(str(message.get("role", "")).encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(str(message.get("content", "")).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EscalationStore:
+    """
+    Interface the app and dashboard talk to (through utils.py).
+    Implementations must be safe to share between Streamlit sessions.
+    """
+    def add_escalation(self, user_query, flagged_ai_response, flag_reason, conversation_history,
+                       session_id=None) -> str:
+        raise NotImplementedError
+
+    def append_turns(self, session_id: str, messages: list, start_index: int = None, base_index: int = 0) -> int:
+        raise NotImplementedError
+
+    def get_turn_count(self, session_id: str) -> int:
+        raise NotImplementedError
+
+    def import_escalations(self, records: list) -> int:
+        raise NotImplementedError
+
+    def get_turns(self, session_id: str, turn_start: int = 0, turn_end: int = None) -> list:
+        raise NotImplementedError
+
+    def get_escalation(self, escalation_id: str):
+        raise NotImplementedError
+
+    def get_escalations(self, status: str = None) -> list:
+        raise NotImplementedError
+
+    def query_escalations(self, status=None, limit=25, cursor=None, reason=None, rule_id=None,
+                          since=None, until=None, newest_first=True):
+        raise NotImplementedError
+
+    def get_changes(self, since_version: int = 0):
+        raise NotImplementedError
+
+    def resolve_escalation(self, escalation_id: str, supervisor_response: str) -> bool:
+        raise NotImplementedError
+
+    def record_rule_hits(self, hits: dict):
+        raise NotImplementedError
+
+    def get_rule_hits(self) -> dict:
+        raise NotImplementedError
+
+
+class SQLiteEscalationStore(EscalationStore):
+    """
+    SQLite store in WAL mode: readers (the dashboard) never block the writer
+    (the chat app), and each write is one small transaction.
+    """
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS escalations (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        id TEXT NOT NULL UNIQUE,
+        timestamp TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'PENDING',
+        user_query TEXT,
+        flag_reason TEXT,
+        flagged_ai_response TEXT,
+        conversation_history TEXT,
+        supervisor_response TEXT,
+        resolved_at TEXT,
+        rule_id TEXT,
+        version INTEGER NOT NULL DEFAULT 0,
+        session_id TEXT,
+        turn_start INTEGER,
+        turn_end INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS messages (
+        hash TEXT PRIMARY KEY,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS session_turns (
+        session_id TEXT NOT NULL,
+        turn_index INTEGER NOT NULL,
+        message_hash TEXT NOT NULL,
+        PRIMARY KEY (session_id, turn_index)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS rule_hits (
+        rule_id TEXT PRIMARY KEY,
+        hits INTEGER NOT NULL DEFAULT 0,
+        last_hit TEXT NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_escalations_status_ts ON escalations (status, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_escalations_ts ON escalations (timestamp);
+    CREATE INDEX IF NOT EXISTS idx_escalations_status_seq ON escalations (status, seq);
+    CREATE INDEX IF NOT EXISTS idx_escalations_rule ON escalations (rule_id);
+    CREATE INDEX IF NOT EXISTS idx_escalations_version ON escalations (version);
+    """
+    # Columns added after the first release of the store; older databases get them via ALTER TABLE.
+    ADDED_COLUMNS = {"rule_id": "TEXT", "version": "INTEGER NOT NULL DEFAULT 0",
+                     "session_id": "TEXT", "turn_start": "INTEGER", "turn_end": "INTEGER"}
+    # Lightweight per-case fields for list views; conversation_history is only read by get_escalation().
+    SUMMARY_COLUMNS = ("seq", "id", "timestamp", "status", "user_query", "flag_reason",
+                       "flagged_ai_response", "rule_id", "supervisor_response", "resolved_at", "version")
+    NEXT_VERSION = "(SELECT COALESCE(MAX(version), 0) + 1 FROM escalations)"
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._connect()
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(escalations)")}
+        if existing:
+            with conn:
+                for column, decl in self.ADDED_COLUMNS.items():
+                    if column not in existing:
+                        conn.execute(f"ALTER TABLE escalations ADD COLUMN {column} {decl}")
+        conn.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; Streamlit runs each session on its own thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _to_dict(self, row) -> dict:
+        record = dict(row)
+        record.pop("seq", None)
+        session_id = record.pop("session_id", None)
+        turn_start = record.pop("turn_start", None)
+        turn_end = record.pop("turn_end", None)
+        if session_id is not None:
+            record["conversation_history"] = self.get_turns(session_id, turn_start, turn_end)
+        elif isinstance(record.get("conversation_history"), str):
+            # Rows written before transcripts were stored by reference.
+            record["conversation_history"] = json.loads(record["conversation_history"])
+        return record
+
+    def append_turns(self, session_id: str, messages: list, start_index: int = None, base_index: int = 0) -> int:
+        """
+        Stores the session's messages from start_index onwards (by default,
+        only the turns not stored yet) and returns the session's turn count.
+        messages[0] is turn base_index, so callers that keep only the tail of
+        a conversation can pass just that tail.
+        Each distinct message body is stored once, however often it appears.
+        """
+        conn = self._connect()
+        with conn:
+            return self._append_turns(conn, session_id, messages, start_index, base_index)
+
+    def _append_turns(self, conn, session_id, messages, start_index, base_index) -> int:
+        # Statements only; the caller owns the transaction.
+        if start_index is None:
+            start_index = self.get_turn_count(session_id)
+        start_index = max(start_index, base_index)
+        new_messages = messages[start_index - base_index:]
+        hashes = [message_hash(message) for message in new_messages]
+        conn.executemany(
+            "INSERT OR IGNORE INTO messages (hash, role, content) VALUES (?, ?, ?)",
+            [(h, m.get("role", ""), m.get("content", "")) for h, m in zip(hashes, new_messages)],
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO session_turns (session_id, turn_index, message_hash) VALUES (?, ?, ?)",
+            [(session_id, start_index + i, h) for i, h in enumerate(hashes)],
+        )
+        return start_index + len(new_messages)
+
+    def get_turn_count(self, session_id: str) -> int:
+        """Number of turns stored for a session."""
+        row = self._connect().execute(
+            "SELECT COALESCE(MAX(turn_index) + 1, 0) FROM session_turns WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        return row[0]
+
+    def get_turns(self, session_id: str, turn_start: int = 0, turn_end: int = None) -> list:
+        """Rebuilds a slice [turn_start, turn_end) of a session's transcript."""
+        rows = self._connect().execute(
+            "SELECT m.role, m.content FROM session_turns t JOIN messages m ON m.hash = t.message_hash "
+            "WHERE t.session_id = ? AND t.turn_index >= ? AND t.turn_index < ? ORDER BY t.turn_index",
+            (session_id, turn_start or 0, turn_end if turn_end is not None else 2 ** 62),
+        )
+        return [{"role": row["role"], "content": row["content"]} for row in rows]
+
+    def add_escalation(self, user_query, flagged_ai_response, flag_reason, conversation_history,
+                       session_id=None, escalation_id=None, timestamp=None, status="PENDING",
+                       supervisor_response=None, resolved_at=None, rule_id=None) -> str:
+        """
+        Records an escalation that references turns [0, len(conversation_history))
+        of the session instead of copying the transcript into the row.
+        With conversation_history=None, the session's turns are already stored
+        (see conversation_state.py) and the case references all of them.
+        """
+        conn = self._connect()
+        with conn:
+            return self._insert_escalation(conn, user_query, flagged_ai_response, flag_reason, conversation_history,
+                                           session_id, escalation_id, timestamp, status, supervisor_response,
+                                           resolved_at, rule_id)[0]
+
+    def _insert_escalation(self, conn, user_query, flagged_ai_response, flag_reason, conversation_history,
+                           session_id=None, escalation_id=None, timestamp=None, status="PENDING",
+                           supervisor_response=None, resolved_at=None, rule_id=None):
+        # Statements only; the caller owns the transaction. Returns (id, whether a row was added).
+        escalation_id = escalation_id or str(uuid.uuid4())
+        session_id = session_id or str(uuid.uuid4())
+        if isinstance(conversation_history, str):
+            conversation_history = json.loads(conversation_history)
+        if conversation_history is None:
+            turn_end = self.get_turn_count(session_id)
+        else:
+            turn_end = self._append_turns(conn, session_id, conversation_history, None, 0)
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO escalations (id, timestamp, status, user_query, flag_reason, "
+            "flagged_ai_response, supervisor_response, resolved_at, rule_id, session_id, turn_start, "
+            f"turn_end, version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?, {self.NEXT_VERSION})",
+            (escalation_id, timestamp or _now(), status, user_query, flag_reason,
+             flagged_ai_response, supervisor_response, resolved_at, rule_id, session_id, turn_end),
+        )
+        return escalation_id, cursor.rowcount == 1
+
+    def import_escalations(self, records: list) -> int:
+        """
+        Adds legacy escalation records in one BEGIN IMMEDIATE transaction, so
+        concurrent importers run one after the other and a crash leaves none
+        of them half-imported. Records without an id get one derived from
+        their content (and a session id derived from that), so importing the
+        same records again adds nothing. Returns the number of new cases.
+        """
+        conn = self._connect()
+        conn.execute(f"PRAGMA busy_timeout = {int(MIGRATION_LOCK_TIMEOUT * 1000)}")
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                added = 0
+                for record in records:
+                    escalation_id = record.get("id") or str(uuid.uuid5(
+                        _LEGACY_NAMESPACE, json.dumps(record, sort_keys=True, default=str)))
+                    added += self._insert_escalation(
+                        conn,
+                        user_query=record.get("user_query"),
+                        flagged_ai_response=record.get("flagged_ai_response"),
+                        flag_reason=record.get("flag_reason"),
+                        conversation_history=record.get("conversation_history", []),
+                        session_id=str(uuid.uuid5(_LEGACY_NAMESPACE, "session:" + escalation_id)),
+                        escalation_id=escalation_id,
+                        timestamp=record.get("timestamp"),
+                        status=record.get("status", "PENDING"),
+                        supervisor_response=record.get("supervisor_response"),
+                        resolved_at=record.get("resolved_at"),
+                        rule_id=record.get("rule_id"),
+                    )[1]
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT * 1000)}")
+        return added
+
+    def get_escalation(self, escalation_id: str):
+        """Full case, with conversation_history rebuilt from the message store."""
+        row = self._connect().execute(
+            "SELECT * FROM escalations WHERE id = ?", (escalation_id,)
+        ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def get_escalations(self, status: str = None) -> list:
+        if status is None:
+            rows = self._connect().execute("SELECT * FROM escalations ORDER BY timestamp")
+        else:
+            rows = self._connect().execute(
+                "SELECT * FROM escalations WHERE status = ? ORDER BY timestamp", (status,)
+            )
+        return [self._to_dict(row) for row in rows.fetchall()]
+
+    def query_escalations(self, status=None, limit=25, cursor=None, reason=None, rule_id=None,
+                          since=None, until=None, newest_first=True):
+        """
+        Returns one page of case summaries (no conversation history) and the
+        cursor for the next page, or None when there are no more cases.
+        Paging is keyset-based on insertion order, so deep pages stay cheap.
+        since/until are ISO-8601 timestamps (inclusive / exclusive).
+        """
+        clauses, params = [], []
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if rule_id:
+            clauses.append("rule_id = ?")
+            params.append(rule_id)
+        if reason:
+            clauses.append("flag_reason LIKE ?")
+            params.append(f"%{reason}%")
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if cursor is not None:
+            clauses.append("seq < ?" if newest_first else "seq > ?")
+            params.append(cursor)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        order = "DESC" if newest_first else "ASC"
+        rows = self._connect().execute(
+            f"SELECT {', '.join(self.SUMMARY_COLUMNS)} FROM escalations {where} "
+            f"ORDER BY seq {order} LIMIT ?",
+            params + [limit + 1],
+        ).fetchall()
+        page = [dict(row) for row in rows[:limit]]
+        next_cursor = page[-1]["seq"] if len(rows) > limit else None
+        return page, next_cursor
+
+    def get_changes(self, since_version: int = 0):
+        """
+        Delta query for polling: summaries of every case added or changed after
+        since_version, plus the version to pass on the next poll.
+        """
+        rows = self._connect().execute(
+            f"SELECT {', '.join(self.SUMMARY_COLUMNS)} FROM escalations "
+            "WHERE version > ? ORDER BY version",
+            (since_version,),
+        ).fetchall()
+        changes = [dict(row) for row in rows]
+        latest = changes[-1]["version"] if changes else since_version
+        return changes, latest
+
+    def get_latest_version(self) -> int:
+        row = self._connect().execute("SELECT COALESCE(MAX(version), 0) FROM escalations").fetchone()
+        return row[0]
+
+    def resolve_escalation(self, escalation_id: str, supervisor_response: str) -> bool:
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE escalations SET status = 'RESOLVED', supervisor_response = ?, resolved_at = ?, "
+                f"version = {self.NEXT_VERSION} "
+                "WHERE id = ? AND status = 'PENDING'",
+                (supervisor_response, _now(), escalation_id),
+            )
+        return cursor.rowcount == 1
+
+    def record_rule_hits(self, hits: dict):
+        """Adds {rule_id: (count, last_hit_iso)} to the per-rule hit counters, in one transaction."""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO rule_hits (rule_id, hits, last_hit) VALUES (?, ?, ?) "
+                "ON CONFLICT(rule_id) DO UPDATE SET hits = hits + excluded.hits, "
+                "last_hit = MAX(last_hit, excluded.last_hit)",
+                [(rule_id, count, last_hit) for rule_id, (count, last_hit) in hits.items()],
+            )
+
+    def get_rule_hits(self) -> dict:
+        """{rule_id: {"hits": n, "last_hit": iso}} for every rule that has fired."""
+        rows = self._connect().execute("SELECT rule_id, hits, last_hit FROM rule_hits")
+        return {row["rule_id"]: {"hits": row["hits"], "last_hit": row["last_hit"]} for row in rows}
+
+
+def migrate_legacy_json(json_path: str, store: EscalationStore) -> int:
+    """
+    One-shot import of the old rewrite-whole-file escalations.json.
+    The legacy file is renamed to '<name>.migrated' afterwards. The import is
+    idempotent (see import_escalations), so a crash before the rename or two
+    processes starting at once cannot duplicate cases.
+    Returns the number of records imported.
+    """
+    if not os.path.exists(json_path):
+        return 0
+    try:
+        with open(json_path, "r") as f:
+            records = json.load(f)
+    except json.JSONDecodeError:
+        records = []
+
+    added = store.import_escalations(records)
+    try:
+        os.replace(json_path, json_path + ".migrated")
+    except FileNotFoundError:
+        pass # Another process finished the same migration first
+    if added:
+        print(f"Migrated {added} escalations from {json_path}.")
+    return added
@@ -0,0 +1,114 @@
+import hashlib
+import io
+import threading
+import numpy as np
+from PIL import Image
+
+# , Page 4: Medical Image Analysis (skin lesions) - preprocessing stage.
+#
+# Uploads are validated from the header only, then decoded straight to the
+# model input size: for JPEGs, Image.draft() lets libjpeg decode at 1/2, 1/4
+# or 1/8 scale, so a 12 MP phone photo is never fully decompressed. Pixels go
+# into preallocated NumPy buffers; the app keeps only the compact uint8 tensor
+# and a content hash, not the raw upload.
+
+MODEL_INPUT_SIZE = 224
+ALLOWED_FORMATS = {"JPEG", "PNG"}
+MAX_PIXELS = 50_000_000 # Rejects decompression bombs before any decoding.
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32) # ImageNet normalization
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+class ImageValidationError(ValueError):
+    pass
+
+
+def content_hash(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def _open_validated(image_bytes: bytes):
+    try:
+        img = Image.open(io.BytesIO(image_bytes)) # Lazy: only the header is parsed.
+    except Exception as e:
+        raise ImageValidationError(f"Unrecognized image data: {e}") from e
+    if img.format not in ALLOWED_FORMATS:
+        raise ImageValidationError(f"Unsupported image format: {img.format}")
+    width, height = img.size
+    if width * height > MAX_PIXELS:
+        raise ImageValidationError(f"Image too large: {width}x{height}")
+    return img
+
+
+def inspect_header(image_bytes: bytes) -> tuple:
+    """Validates format and dimensions without decoding pixel data. Returns (format, (w, h))."""
+    img = _open_validated(image_bytes)
+    return img.format, img.size
+
+
+def decode_into(image_bytes: bytes, out: np.ndarray, size: int = MODEL_INPUT_SIZE):
+    """Decodes one image at reduced resolution into a preallocated (size, size, 3) uint8 view."""
+    img = _open_validated(image_bytes)
+    if img.format == "JPEG":
+        img.draft("RGB", (size, size)) # Smallest DCT scale that is still >= size.
+    img = img.convert("RGB")
+    # reducing_gap lets Pillow shrink by an integer factor first (cheap), then resample.
+    img = img.resize((size, size), Image.BILINEAR, reducing_gap=2.0)
+    out[...] = np.asarray(img, dtype=np.uint8)
+
+
+def preprocess_batch(images: list, size: int = MODEL_INPUT_SIZE) -> tuple:
+    """
+    Decodes several uploads into one (n, size, size, 3) uint8 batch.
+    Returns (batch, hashes, errors); rows that failed validation are left
+    zeroed and their error message is recorded at the same index.
+    """
+    batch = np.zeros((len(images), size, size, 3), dtype=np.uint8)
+    hashes, errors = [], []
+    for i, image_bytes in enumerate(images):
+        hashes.append(content_hash(image_bytes))
+        try:
+            decode_into(image_bytes, batch[i], size)
+            errors.append(None)
+        except Exception as e:
+            errors.append(str(e))
+    return batch, hashes, errors
+
+
+def normalize(batch: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """uint8 (n, h, w, 3) -> normalized float32, written into `out` if given."""
+    if out is None:
+        out = np.empty(batch.shape, dtype=np.float32)
+    np.multiply(batch, np.float32(1.0 / 255.0), out=out)
+    out -= MEAN
+    out /= STD
+    return out
+
+
+class MockLesionClassifier:
+    """
+    Stand-in for the skin-lesion CNN: classifies from the spread of luminance
+    in the central region, so results are deterministic for a given image.
+    Normalization reuses a per-thread float32 buffer instead of allocating
+    one per request.
+    """
+    version = "mock-cnn-v1"
+    THRESHOLDS = (0.6, 1.0) # Luminance std (normalized units) for Suspicious / Concerning.
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _buffer(self, shape) -> np.ndarray:
+        buf = getattr(self._local, "buf", None)
+        if buf is None or buf.shape[0] < shape[0] or buf.shape[1:] != shape[1:]:
+            buf = np.empty(shape, dtype=np.float32)
+            self._local.buf = buf
+        return buf[:shape[0]]
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """uint8 (n, h, w, 3) batch -> class indices (0: Benign, 1: Suspicious, 2: Concerning)."""
+        x = normalize(batch, self._buffer(batch.shape))
+        h, w = x.shape[1:3]
+        center = x[:, h // 4: 3 * h // 4, w // 4: 3 * w // 4].mean(axis=3)
+        spread = center.reshape(len(x), -1).std(axis=1)
+        return np.searchsorted(self.THRESHOLDS, spread, side="right")
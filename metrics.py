@@ -0,0 +1,269 @@
+import bisect
+import contextvars
+import cProfile
+import io
+import os
+import pstats
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+# : Per-turn latency instrumentation for the Triad pipeline.
+#
+# Code marks its stages with metrics.span("stage", **labels). Every span is
+# added to a fixed-bucket histogram per (stage, labels) series, so memory
+# does not grow with traffic and p50/p95/p99 are read off the buckets, and
+# to the trace of the turn it belongs to (held in a context variable, so
+# asyncio tasks of the same turn share it). The last few traces are kept
+# for the Supervisor Dashboard, and everything can be exported in the
+# Prometheus text format.
+#
+# metrics.profile() captures cProfile + tracemalloc data for one request.
+
+# Bucket upper bounds in seconds: 1 / 1.5 / 2 / 3 / 5 / 7.5 steps per decade, 0.1 ms to 60 s.
+BUCKETS = tuple(round(m * 10.0 ** e, 6) for e in range(-4, 2) for m in (1, 1.5, 2, 3, 5, 7.5)) + (60.0,)
+RECENT_TRACES = 50
+RECENT_PROFILES = 5
+PROFILE_TOP_N = 25
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+# tracemalloc (and, on newer Pythons, cProfile) is process-wide: one profiled request at a time.
+_profile_lock = threading.Lock()
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1) # Last slot: above the largest bound (+Inf)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        """Estimated q-th percentile (0-100), interpolated inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q / 100.0 * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            if n and cumulative + n >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(lower + (upper - lower) * (rank - cumulative) / n, self.max)
+            cumulative += n
+        return self.max
+
+
+class Trace:
+    """Spans of one request/turn, as (stage, labels, start offset, duration) in seconds."""
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.spans = []
+        self.attributes = {}
+        self.total = None
+
+    def offset(self) -> float:
+        return time.perf_counter() - self._start
+
+    def as_dict(self) -> dict:
+        return {"name": self.name, "started_at": self.started_at, "total": self.total,
+                "attributes": dict(self.attributes),
+                "spans": [{"stage": stage, "labels": labels, "start": start, "duration": duration}
+                          for stage, labels, start, duration in self.spans]}
+
+
+class _Span:
+    """Context manager timing one stage (a plain class: cheaper than @contextmanager)."""
+    __slots__ = ("metrics", "stage", "labels", "start")
+
+    def __init__(self, metrics, stage: str, labels: dict):
+        self.metrics = metrics
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {} # (stage, ((label, value), ...)) -> Histogram
+        self._counters = {} # (name, ((label, value), ...)) -> int
+        self.recent_traces = deque(maxlen=RECENT_TRACES)
+        self.recent_profiles = deque(maxlen=RECENT_PROFILES)
+        self._profiling = contextvars.ContextVar("profiling", default=False)
+
+    # --- Recording ---
+
+    def observe(self, stage: str, seconds: float, **labels):
+        key = (stage, tuple(sorted((k, str(v)) for k, v in labels.items()))) if labels else (stage, ())
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append((stage, dict(key[1]), max(trace.offset() - seconds, 0.0), seconds))
+
+    def increment(self, name: str, amount: int = 1, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def span(self, stage: str, **labels) -> _Span:
+        return _Span(self, stage, labels)
+
+    @contextmanager
+    def trace(self, name: str):
+        """Starts the trace of one request/turn; its total is recorded as stage `name`."""
+        trace = Trace(name)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            trace.total = trace.offset()
+            self.observe(name, trace.total)
+            self.recent_traces.append(trace.as_dict())
+
+    @staticmethod
+    def current_trace():
+        return _current_trace.get()
+
+    # --- Profiling ---
+
+    def profiling_active(self) -> bool:
+        return self._profiling.get()
+
+    @contextmanager
+    def profile(self, enabled: bool = True, label: str = "request"):
+        """
+        Captures cProfile (CPU, top functions by cumulative time) and
+        tracemalloc (allocations by line, peak) for the enclosed code. cProfile
+        only sees the calling thread, so code that normally runs on a pool
+        should check profiling_active() and run inline while profiling.
+
+        Profiled requests are serialized (a second one waits for the first),
+        since tracemalloc is global. Allocations and the peak still cover the
+        whole process, including unprofiled requests running at the same time.
+        """
+        if not enabled:
+            yield None
+            return
+        with _profile_lock:
+            result = {"label": label, "started_at": time.time()}
+            token = self._profiling.set(True)
+            started_tracemalloc = not tracemalloc.is_tracing()
+            if started_tracemalloc:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                yield result
+            finally:
+                profiler.disable()
+                result["wall_seconds"] = time.perf_counter() - start
+                after = tracemalloc.take_snapshot()
+                result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+                if started_tracemalloc:
+                    tracemalloc.stop()
+                self._profiling.reset(token)
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+            result["cpu"] = out.getvalue()
+            result["memory"] = [str(stat) for stat in after.compare_to(before, "lineno")[:15]]
+            self.recent_profiles.append(result)
+
+    # --- Reading / export ---
+
+    def snapshot(self) -> list:
+        """One row per series: stage, labels, count, mean/p50/p95/p99/max in milliseconds."""
+        with self._lock:
+            items = [(key, h.count, h.sum, h.max, h.percentile(50), h.percentile(95), h.percentile(99))
+                     for key, h in self._histograms.items()]
+        rows = []
+        for (stage, labels), count, total, maximum, p50, p95, p99 in sorted(items):
+            rows.append({"stage": stage, "labels": ",".join(f"{k}={v}" for k, v in labels), "count": count,
+                         "mean_ms": total / count * 1000, "p50_ms": p50 * 1000, "p95_ms": p95 * 1000,
+                         "p99_ms": p99 * 1000, "max_ms": maximum * 1000})
+        return rows
+
+    def counters(self) -> dict:
+        with self._lock:
+            return {(name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else name): value
+                    for (name, labels), value in sorted(self._counters.items())}
+
+    def to_prometheus(self, prefix: str = "triad") -> str:
+        """Prometheus text exposition format (histograms + counters), labelled with this process id."""
+        pid = str(os.getpid())
+
+        def fmt(labels):
+            return ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+
+        lines = [f"# HELP {prefix}_stage_duration_seconds Time spent per pipeline stage.",
+                 f"# TYPE {prefix}_stage_duration_seconds histogram"]
+        with self._lock:
+            histograms = [(key, list(h.counts), h.count, h.sum) for key, h in sorted(self._histograms.items())]
+            counters = sorted(self._counters.items())
+        for (stage, labels), counts, count, total in histograms:
+            base = (("stage", stage),) + labels + (("pid", pid),)
+            cumulative = 0
+            for bound, n in zip(BUCKETS, counts):
+                cumulative += n
+                lines.append(f'{prefix}_stage_duration_seconds_bucket{{{fmt(base)},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_duration_seconds_bucket{{{fmt(base)},le="+Inf"}} {count}')
+            lines.append(f"{prefix}_stage_duration_seconds_sum{{{fmt(base)}}} {total:.6f}")
+            lines.append(f"{prefix}_stage_duration_seconds_count{{{fmt(base)}}} {count}")
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {prefix}_{name} counter")
+                declared.add(name)
+            lines.append(f"{prefix}_{name}{{{fmt(labels + (('pid', pid),))}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Atomically writes the Prometheus text file (e.g. for a node-exporter textfile collector)."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".metrics.", suffix=".tmp", dir=directory)
+        with os.fdopen(fd, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+        self.recent_traces.clear()
+        self.recent_profiles.clear()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Process-wide metrics shared by the chat app, the dashboard and the server.
+metrics = Metrics()
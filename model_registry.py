@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+
+# : Process-wide registry of the Cognitive Engine's models.
+#
+# Models are registered as loader functions and only loaded the first time
+# they are needed (or by an optional background warm-up). Heavy libraries are
+# imported inside the loaders, so importing the app stays cheap. There is one
+# registry per process, shared by every Streamlit session and page.
+
+
+def _rss_bytes() -> int:
+    """Current resident set size of this process (0 if unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._locks = {}
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader):
+        """Registers a zero-argument loader. Re-registering drops a loaded model."""
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+            self._models.pop(name, None)
+            self._metrics[name] = {"loaded": False, "load_seconds": None, "memory_bytes": None, "error": None}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._loaders
+
+    def get(self, name: str):
+        """Returns the model, loading it on first use. Concurrent callers share one load."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if name not in self._loaders:
+            raise KeyError(f"Unknown model: {name}")
+        with self._locks[name]:
+            model = self._models.get(name)
+            if model is None:
+                rss_before = _rss_bytes()
+                start = time.perf_counter()
+                try:
+                    model = self._loaders[name]()
+                except Exception as e:
+                    self._metrics[name]["error"] = str(e)
+                    raise
+                # RSS delta is approximate if other models load at the same time.
+                self._metrics[name] = {
+                    "loaded": True,
+                    "load_seconds": time.perf_counter() - start,
+                    "memory_bytes": max(_rss_bytes() - rss_before, 0),
+                    "error": None,
+                }
+                self._models[name] = model
+                print(f"Model '{name}' loaded in {self._metrics[name]['load_seconds']:.2f}s.")
+        return model
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def warm_up(self, names=None, background: bool = True):
+        """
+        Loads the given models (default: all registered) ahead of the first
+        request. With background=True this runs on a daemon thread and
+        returns it; failures are recorded in metrics() instead of raised.
+        """
+        names = list(names or self._loaders)
+
+        def _load_all():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"Warning: warm-up of model '{name}' failed: {e}")
+
+        if not background:
+            _load_all()
+            return None
+        thread = threading.Thread(target=_load_all, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def metrics(self) -> dict:
+        """Per-model load state, load time (s) and approximate memory (bytes)."""
+        return {name: dict(values) for name, values in self._metrics.items()}
+
+
+registry = ModelRegistry()
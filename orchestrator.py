@@ -0,0 +1,377 @@
+import argparse
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+
+# : Tool orchestration for one chat turn (Cognitive, Empathic, Ethical Engines).
+#
+# A router picks every tool a query needs, and the orchestrator runs them
+# concurrently: blocking model code goes to a bounded thread pool (NumPy and
+# Pillow release the GIL, so tools genuinely overlap), each tool has its own
+# timeout, and the query-level ethical check runs alongside them. If that
+# check blocks or escalates the query, the still-running tool calls are
+# cancelled. Results are merged into a single draft response, or, with
+# stream_turn, released section by section as each tool finishes.
+# The (simulated) LLM call receives build_prompt(): the Empathic Engine's
+# system prompt plus the session context (summary, key facts, recent window,
+# see conversation_state.py); it is returned with the turn as "prompt".
+# Every stage and tool call is recorded as a span (see metrics.py); while a
+# request is being profiled, tools run inline so cProfile sees them.
+#
+# Works the same from Streamlit, the HTTP server or the command line.
+
+DEFAULT_TIMEOUTS = {"image": 10.0, "risk": 5.0, "rag": 5.0, "sentiment": 2.0}
+TOOL_ORDER = ("image", "risk", "rag") # Section order of a merged (non-streamed) draft
+
+FALLBACK_RESPONSE = "I am a healthcare education bot. I can provide information on preventive health, analyze (mock) health data you provide, and analyze (mock) medical images you upload. Please ask about general health topics, risk assessments, or upload an image for analysis."
+EMPATHY_PREFIX = "I'm sorry you're feeling this way, and I'm here to help. "
+
+
+def route(query: str, vitals: dict = None, images=None) -> list:
+    """Every tool the turn needs (previously at most one was chosen by if/elif)."""
+    query_lower = query.lower()
+    tools = ["sentiment"]
+    if images is not None and len(images):
+        tools.append("image")
+    if "risk" in query_lower or "vitals" in query_lower or "score" in query_lower:
+        tools.append("risk")
+    if "hypertension" in query_lower or "blood pressure" in query_lower or "who recommends" in query_lower:
+        tools.append("rag")
+    return tools
+
+
+class Orchestrator:
+    def __init__(self, triad: dict, max_workers: int = 8, timeouts: dict = None, simulated_llm_latency: float = 0.0):
+        self.cognitive = triad["cognitive"]
+        self.empathic = triad["empathic"]
+        self.ethical = triad["ethical"]
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.simulated_llm_latency = simulated_llm_latency
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="triad-tool")
+
+    def _tool_fn(self, name: str, query: str, vitals: dict, images, session_id: str = None):
+        if name == "image":
+            return lambda: self.cognitive.run_image_analysis_batch(images)
+        if name == "risk":
+            return lambda: self.cognitive.run_risk_prediction(vitals or {})
+        if name == "rag":
+            return lambda: self.cognitive.run_rag(query)
+        if name == "sentiment":
+            if session_id is not None:
+                return lambda: self.empathic.track_sentiment(session_id, query)
+            return lambda: self.empathic.detect_sentiment(query)
+        raise KeyError(f"Unknown tool: {name}")
+
+    async def _call(self, name: str, fn):
+        """Runs one blocking tool in the pool with its timeout. Returns (result, error, seconds)."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            if metrics.profiling_active():
+                return fn(), None, time.perf_counter() - start
+            result = await asyncio.wait_for(loop.run_in_executor(self.executor, fn), self.timeouts.get(name))
+            return result, None, time.perf_counter() - start
+        except asyncio.TimeoutError:
+            # The worker thread cannot be interrupted; its late result is simply discarded.
+            outcome = "timeout"
+            return None, "timeout", time.perf_counter() - start
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            outcome = "error"
+            return None, f"{type(e).__name__}: {e}", time.perf_counter() - start
+        finally:
+            metrics.observe("tool", time.perf_counter() - start, tool=name, outcome=outcome)
+
+    def _start_tools(self, tools: list, query: str, vitals: dict, images, session_id: str = None) -> dict:
+        return {
+            name: asyncio.ensure_future(self._call(name, self._tool_fn(name, query, vitals, images, session_id)))
+            for name in tools
+        }
+
+    async def _check_query(self, query: str) -> dict:
+        """The query-level ethical check (rules on the query alone)."""
+        check = lambda: self.ethical.validate_response(user_query=query, draft_response="")
+        with metrics.span("query_check"):
+            if metrics.profiling_active():
+                return check()
+            return await asyncio.get_running_loop().run_in_executor(self.executor, check)
+
+    @staticmethod
+    async def _settle(name: str, task, out: dict):
+        """Awaits one tool task and files its result, error or cancellation into `out`."""
+        try:
+            result, error, seconds = await task
+        except asyncio.CancelledError:
+            out["errors"][name] = "cancelled"
+            out["cancelled"].append(name)
+            return
+        out["timings"][name] = seconds
+        if error is None:
+            out["results"][name] = result
+        else:
+            out["errors"][name] = error
+
+    async def run_tools(self, query: str, vitals: dict = None, images=None, tools: list = None,
+                        session_id: str = None) -> dict:
+        """
+        Runs the routed tools concurrently, alongside the query-level ethical
+        check. Returns {"results", "errors", "timings", "query_validation", "cancelled"}.
+        """
+        tools = tools if tools is not None else route(query, vitals, images)
+        tasks = self._start_tools(tools, query, vitals, images, session_id)
+        query_validation = await self._check_query(query)
+        if query_validation["status"] != "APPROVED":
+            # The answer will be the rule's canned message: stop work nobody will read.
+            for task in tasks.values():
+                task.cancel()
+
+        out = {"results": {}, "errors": {}, "timings": {}, "cancelled": []}
+        for name, task in tasks.items():
+            await self._settle(name, task, out)
+        return dict(out, query_validation=query_validation)
+
+    @staticmethod
+    def section(name: str, result) -> str:
+        """The draft paragraph for one tool's result ('' for tools that add no text)."""
+        if name == "image":
+            findings = [f"{r['content']} \n\n**Explanation:** {r['explanation']}" for r in result]
+            if len(findings) == 1:
+                return f"I have analyzed the image you uploaded. {findings[0]}"
+            return "I have analyzed the images you uploaded.\n\n" + "\n\n".join(
+                f"**Image {i + 1}:** {finding}" for i, finding in enumerate(findings)
+            )
+        if name == "risk":
+            return f"{result['content']} \n\n**Explanation:** {result['explanation']}"
+        if name == "rag":
+            return f"According to my knowledge base: {result['content']} (Source: {result['source']})"
+        return ""
+
+    @classmethod
+    def merge(cls, results: dict) -> str:
+        """Combines the tool outputs into one draft response."""
+        parts = [cls.section(name, results[name]) for name in TOOL_ORDER if name in results]
+        if not parts:
+            # Fallback response for general queries
+            return FALLBACK_RESPONSE
+        draft = "\n\n".join(parts)
+        sentiment = results.get("sentiment")
+        if sentiment and sentiment.get("status") == "High Distress":
+            draft = EMPATHY_PREFIX + draft
+        return draft
+
+    def build_prompt(self, query: str, context: dict = None) -> list:
+        """Messages for the LLM call: system prompt (+ session summary and facts), recent window, query."""
+        system = self.empathic.get_system_prompt().strip()
+        context = context or {}
+        if context.get("summary"):
+            system += "\n\n" + context["summary"]
+        facts = context.get("facts") or {}
+        if facts.get("vitals"):
+            system += "\n\nLatest vitals: " + json.dumps(facts["vitals"])
+        if facts.get("flagged_topics"):
+            system += "\nPreviously flagged: " + "; ".join(t["query"] for t in facts["flagged_topics"])
+        messages = [{"role": "system", "content": system}]
+        messages += [{"role": m["role"], "content": m["content"]} for m in context.get("messages") or []]
+        if messages[-1]["role"] != "user" or messages[-1]["content"] != query: # The window may already end with it
+            messages.append({"role": "user", "content": query})
+        return messages
+
+    async def run_turn(self, query: str, vitals: dict = None, images=None, session_id: str = None,
+                       context: dict = None) -> dict:
+        """
+        Full draft step for one turn: fan out tools, merge, then run the
+        complete ethical check on the draft. Returns a dict with draft,
+        validation, sentiment, tool_results, errors, timings and the LLM prompt
+        built from `context` (ConversationState.context()).
+        With a session_id, sentiment is the session's running distress estimate.
+        """
+        start = time.perf_counter()
+        prompt = self.build_prompt(query, context)
+        with metrics.span("tools"):
+            tools = await self.run_tools(query, vitals, images, session_id=session_id)
+        with metrics.span("merge"):
+            draft = self.merge(tools["results"])
+
+        # Simulated LLM latency, skipped when every tool answer came from the cache
+        tool_results = [r for name, r in tools["results"].items() if name != "sentiment"]
+        flat = [r for result in tool_results for r in (result if isinstance(result, list) else [result])]
+        if self.simulated_llm_latency and not (flat and all(r.get("cached") for r in flat)):
+            with metrics.span("llm_wait"):
+                await asyncio.sleep(self.simulated_llm_latency)
+
+        if tools["query_validation"]["status"] != "APPROVED":
+            validation = tools["query_validation"]
+        else:
+            with metrics.span("validate"):
+                validation = self.ethical.validate_response(user_query=query, draft_response=draft)
+        return {
+            "draft": draft,
+            "prompt": prompt,
+            "validation": validation,
+            "sentiment": tools["results"].get("sentiment"),
+            "tool_results": tools["results"],
+            "errors": tools["errors"],
+            "cancelled": tools["cancelled"],
+            "timings": dict(tools["timings"], total=time.perf_counter() - start),
+        }
+
+    def run_turn_sync(self, query: str, vitals: dict = None, images=None, session_id: str = None,
+                      context: dict = None) -> dict:
+        """Blocking wrapper for callers without an event loop (e.g. the Streamlit script thread)."""
+        return asyncio.run(self.run_turn(query, vitals, images, session_id, context))
+
+    async def stream_sections(self, turn: dict, query: str, vitals: dict = None, images=None, session_id: str = None,
+                              context: dict = None):
+        """
+        Streaming variant of run_turn: yields the draft section by section, each
+        as soon as its tool finishes (completion order), instead of waiting for
+        the slowest tool. Nothing is yielded for a blocked/escalated query or a
+        low-confidence turn; `turn` is filled in as the stream advances (same
+        keys as run_turn), so it is usable even if the consumer stops early.
+        """
+        start = time.perf_counter()
+        out = {"results": {}, "errors": {}, "timings": {}, "cancelled": []}
+        turn.update(draft="", prompt=self.build_prompt(query, context), validation=None, sentiment=None, tool_results=out["results"],
+                    errors=out["errors"], cancelled=out["cancelled"], timings=out["timings"])
+        tasks = self._start_tools(route(query, vitals, images), query, vitals, images, session_id)
+        try:
+            turn["validation"] = await self._check_query(query)
+            if turn["validation"]["status"] != "APPROVED":
+                for task in tasks.values():
+                    task.cancel()
+                for name, task in tasks.items():
+                    await self._settle(name, task, out)
+                return
+
+            # The empathy prefix depends on sentiment, so that one is awaited first (it is fast).
+            if "sentiment" in tasks:
+                await self._settle("sentiment", tasks.pop("sentiment"), out)
+                turn["sentiment"] = out["results"].get("sentiment")
+            names = {task: name for name, task in tasks.items()}
+            pending, parts = set(tasks.values()), []
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda t: TOOL_ORDER.index(names[t])):
+                    name = names[task]
+                    await self._settle(name, task, out)
+                    if name not in out["results"]:
+                        continue
+                    text = self.section(name, out["results"][name])
+                    if not parts:
+                        # Simulated LLM time to first token, skipped when this answer came from the cache
+                        result = out["results"][name]
+                        cached = all(r.get("cached") for r in (result if isinstance(result, list) else [result]))
+                        if self.simulated_llm_latency and not cached:
+                            with metrics.span("llm_wait"):
+                                await asyncio.sleep(self.simulated_llm_latency)
+                        sentiment = turn["sentiment"]
+                        if sentiment and sentiment.get("status") == "High Distress":
+                            text = EMPATHY_PREFIX + text
+                    else:
+                        text = "\n\n" + text
+                    parts.append(text)
+                    turn["draft"] = "".join(parts)
+                    yield text
+
+            with metrics.span("validate"):
+                turn["validation"] = self.ethical.validate_response(
+                    user_query=query, draft_response=turn["draft"] or FALLBACK_RESPONSE
+                )
+            if not parts:
+                turn["draft"] = FALLBACK_RESPONSE
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            out["timings"]["total"] = time.perf_counter() - start
+
+    def stream_turn(self, query: str, vitals: dict = None, images=None, session_id: str = None,
+                    context: dict = None) -> "TurnStream":
+        """Blocking iterator over stream_sections for callers without an event loop."""
+        return TurnStream(self, query, vitals, images, session_id, context)
+
+
+class TurnStream:
+    """
+    Iterates the draft sections of one turn as they become ready, driving a
+    private event loop one step per section. `turn` holds the run_turn-style
+    result (draft, validation, sentiment, errors, timings); call close() when
+    stopping early so unfinished tool calls are cancelled.
+    """
+    def __init__(self, orchestrator: Orchestrator, query: str, vitals: dict = None, images=None, session_id: str = None,
+                 context: dict = None):
+        self.turn = {}
+        self._sections = orchestrator.stream_sections(self.turn, query, vitals, images, session_id, context)
+        self._iterator = self._run()
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(self._sections.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            loop.run_until_complete(self._sections.aclose())
+            # Let cancelled tool calls unwind before the loop goes away.
+            leftover = asyncio.all_tasks(loop)
+            if leftover:
+                loop.run_until_complete(asyncio.gather(*leftover, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    def __iter__(self):
+        return self._iterator
+
+    def close(self):
+        self._iterator.close()
+
+
+_orchestrators = {}
+_orchestrator_lock = threading.Lock()
+
+def get_orchestrator(**kwargs) -> Orchestrator:
+    """
+    Process-wide orchestrator over the shared engines (see agent_architecture.get_triad),
+    one per distinct set of Orchestrator arguments (each has its own thread pool).
+    """
+    key = json.dumps(kwargs, sort_keys=True, default=str)
+    with _orchestrator_lock:
+        orchestrator = _orchestrators.get(key)
+        if orchestrator is None:
+            from agent_architecture import get_triad
+            orchestrator = _orchestrators[key] = Orchestrator(get_triad(), **kwargs)
+        return orchestrator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one Triad turn headless and print the result as JSON.")
+    parser.add_argument("query")
+    parser.add_argument("--age", type=int, default=50)
+    parser.add_argument("--bp", default="120/80")
+    parser.add_argument("--image", action="append", default=[], help="Image file to analyze (repeatable).")
+    parser.add_argument("--profile", action="store_true", help="Print a cProfile/tracemalloc report after the result.")
+    args = parser.parse_args()
+
+    images = []
+    for path in args.image:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    with metrics.profile(args.profile, label=args.query) as profile, metrics.trace("turn"):
+        turn = get_orchestrator().run_turn_sync(args.query, {"age": args.age, "bp": args.bp}, images or None)
+    print(json.dumps(turn, indent=2, default=str))
+    if profile is not None:
+        print(profile["cpu"])
+        print(f"Peak traced memory: {profile['peak_bytes'] / 1024:.1f} KB")
+        print("\n".join(profile["memory"]))
+
+
+if __name__ == "__main__":
+    main()
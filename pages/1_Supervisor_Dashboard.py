@@ -1,7 +1,11 @@
 import streamlit as st
 import utils
-import json
 import os # Import os to check for file existence
+from agent_architecture import get_triad
+from metrics import metrics
+from model_registry import registry
+from tool_cache import tool_cache
+from datetime import datetime, time as dt_time, timedelta, timezone
 
 st.set_page_config(
     page_title="Supervisor Dashboard",
@@ -14,36 +18,125 @@ st.markdown("Review and resolve AI-flagged conversations. This feedback drives t
 
 # , Page 18: This dashboard is the source of feedback for Level 4 evolution.
 
-# Initialize EthicalEngine if not already in session state.
-# This ensures that even if a user navigates directly to this page,
-# the ethical engine and its rules are correctly loaded.
-if 'ethical_engine_dashboard' not in st.session_state:
-    from agent_architecture import EthicalEngine
-    st.session_state.ethical_engine_dashboard = EthicalEngine(rules_file=utils.RULES_FILE)
-ethical_engine_dashboard = st.session_state.ethical_engine_dashboard
+PAGE_SIZE = 25
+
+# The dashboard uses the same process-wide EthicalEngine as the chat app, so
+# rules written by the Level 4 loop are live for every session at once.
+# (Also works when a user navigates directly to this page.)
+ethical_engine = get_triad(rules_file=utils.RULES_FILE)["ethical"]
 
 # Ensure the database is initialized (important for fresh deployments)
 if not os.path.exists(utils.DB_NAME):
     utils.init_db()
 
 
+def case_title(case):
+    return f"**Case ID:** {case['id'][:8]} | **Time:** {case['timestamp'].split('T')[0]} | **Reason:** {case['flag_reason']}"
+
+
+def render_history(case_id):
+    # Full history is only fetched when the supervisor asks for it.
+    full_case = utils.get_escalation(case_id)
+    history = full_case['conversation_history'] if full_case else []
+    for msg in history:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+
+
+# --- Filters ---
+with st.sidebar:
+    st.header("🔎 Filters")
+    reason_filter = st.text_input("Reason contains", key="filter_reason").strip()
+    rule_filter = st.text_input("Rule ID", key="filter_rule_id").strip()
+    date_range = st.date_input("Date range", value=(), key="filter_dates")
+
+    # Models are shared with the chat app; this shows what is loaded in this process.
+    with st.expander("🧠 Model status"):
+        st.json(registry.metrics())
+    with st.expander("🗃️ Tool cache"):
+        st.json(tool_cache.stats())
+    with st.expander("📜 Rule set"):
+        st.json(ethical_engine.rule_set.metrics())
+
+since = until = None
+if len(date_range) == 2:
+    since = datetime.combine(date_range[0], dt_time.min, tzinfo=timezone.utc).isoformat()
+    until = datetime.combine(date_range[1] + timedelta(days=1), dt_time.min, tzinfo=timezone.utc).isoformat()
+filters = (reason_filter, rule_filter, since, until)
+
+
+def matches_filters(case):
+    if reason_filter and reason_filter not in (case['flag_reason'] or ""):
+        return False
+    if rule_filter and case['rule_id'] != rule_filter:
+        return False
+    if since and case['timestamp'] < since:
+        return False
+    if until and case['timestamp'] >= until:
+        return False
+    return True
+
+
+# --- Pending queue: full load once, then "since last poll" deltas ---
+if 'pending_cases' not in st.session_state:
+    st.session_state.pending_version = utils.get_escalations_version()
+    pending = {}
+    cursor = None
+    while True:
+        page, cursor = utils.query_escalations(status="PENDING", limit=500, cursor=cursor, newest_first=False)
+        pending.update((case['id'], case) for case in page)
+        if cursor is None:
+            break
+    st.session_state.pending_cases = pending
+else:
+    changes, st.session_state.pending_version = utils.get_escalation_changes(st.session_state.pending_version)
+    for case in changes:
+        if case['status'] == "PENDING":
+            st.session_state.pending_cases[case['id']] = case
+        else:
+            st.session_state.pending_cases.pop(case['id'], None)
+
+# --- Resolved cases: keyset-paginated server-side queries ---
+if st.session_state.get('resolved_filters') != filters:
+    st.session_state.resolved_filters = filters
+    st.session_state.resolved_cursors = [None]
+
+
 # --- Dashboard UI ---
-tab1, tab2 = st.tabs(["Pending Escalations", "Resolved Cases"])
+# Outcome of the last Level 4 evolution step (shown once after the rerun)
+report = st.session_state.pop('last_evolution_report', None)
+if report:
+    st.info(
+        f"Level 4 evolution: candidate rule {report['candidate']!r} was {report['outcome']}. "
+        f"Rules {report['rules_before']} → {report['rules_after']} "
+        f"(retired {len(report['removed']['retired'])}, merged/subsumed "
+        f"{len(report['removed']['duplicate']) + len(report['removed']['subsumed'])}); "
+        f"validation {report['latency_before_us']} µs → {report['latency_after_us']} µs per query."
+    )
+    if report['outcome'] == "rejected":
+        st.warning("No rule was created: the query is too generic to block on (fewer than two content words). "
+                   "Add a rule to rules.json by hand if one is needed.")
+    elif report['outcome'] == "conflict":
+        st.warning(f"No rule was created: an evolved rule for {report['candidate']!r} already gives a different "
+                   "answer. Edit rules.json to choose between them.")
+
+tab1, tab2, tab3 = st.tabs(["Pending Escalations", "Resolved Cases", "Metrics"])
 
 with tab1:
     st.header("Pending Escalations")
-    pending_cases = utils.get_escalations(status="PENDING")
+    pending_cases = [case for case in st.session_state.pending_cases.values() if matches_filters(case)]
+    pending_cases.sort(key=lambda case: case['seq'])
 
     if not pending_cases:
         st.success("No pending cases in the review queue.")
+    else:
+        st.caption(f"{len(pending_cases)} pending case(s). Showing the oldest {min(len(pending_cases), PAGE_SIZE)}.")
 
-    for case in pending_cases:
-        with st.expander(f"**Case ID:** {case['id'][:8]} | **Time:** {case['timestamp'].split('T')[0]} | **Reason:** {case['flag_reason']}"):
+    for case in pending_cases[:PAGE_SIZE]:
+        with st.expander(case_title(case)):
             st.subheader("Conversation History")
-            history = json.loads(case['conversation_history'])
-            for msg in history:
-                with st.chat_message(msg["role"]):
-                    st.markdown(msg["content"])
+            if st.checkbox("Load conversation history", key=f"history_{case['id']}"):
+                render_history(case['id'])
 
             st.subheader("Flagged Interaction Details")
             with st.chat_message("user"):
@@ -65,12 +158,12 @@ with tab1:
                     # 2. Trigger the Level 4 Evolution Loop
                     # , Page 31: "Cherish Human Feedback"
                     # The agent now consumes this feedback to self-evolve.
-                    case['supervisor_response'] = supervisor_response # Add for loop
-                    utils.level_4_evolution_loop(case)
+                    case = utils.get_escalation(case['id'])
+                    st.session_state.last_evolution_report = utils.level_4_evolution_loop(case)
 
-                    # 3. Reload rules in the EthicalEngine instance specific to the dashboard
-                    # This ensures the dashboard's EthicalEngine is aware of new rules for consistency.
-                    ethical_engine_dashboard.reload_rules()
+                    # 3. Publish the new rules version to every session now, without
+                    # waiting for the next rules.json change check.
+                    ethical_engine.reload_rules()
 
                     st.success(f"Case {case['id'][:8]} resolved and Level 4 learning loop triggered.")
                     st.rerun() # Rerun to refresh the list of pending cases
@@ -79,11 +172,77 @@ with tab1:
 
 with tab2:
     st.header("Resolved Cases")
-    resolved_cases = utils.get_escalations(status="RESOLVED")
+    cursors = st.session_state.resolved_cursors
+    resolved_cases, next_cursor = utils.query_escalations(
+        status="RESOLVED", limit=PAGE_SIZE, cursor=cursors[-1],
+        reason=reason_filter or None, rule_id=rule_filter or None, since=since, until=until
+    )
 
     if not resolved_cases:
         st.info("No resolved cases yet.")
 
     for case in resolved_cases:
-        with st.expander(f"**Case ID:** {case['id'][:8]} | **Time:** {case['timestamp'].split('T')[0]} | **Reason:** {case['flag_reason']}"):
+        with st.expander(case_title(case)):
             st.json(case, expanded=False)
+            if st.checkbox("Load conversation history", key=f"resolved_history_{case['id']}"):
+                render_history(case['id'])
+
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if len(cursors) > 1 and st.button("← Newer", key="resolved_prev"):
+            cursors.pop()
+            st.rerun()
+    with col_page:
+        st.caption(f"Page {len(cursors)}")
+    with col_next:
+        if next_cursor is not None and st.button("Older →", key="resolved_next"):
+            cursors.append(next_cursor)
+            st.rerun()
+
+with tab3:
+    # Stage timings recorded by this process (chat sessions and the dashboard share it);
+    # each server worker exposes its own on GET /metrics.
+    st.header("Pipeline Latency")
+    rows = metrics.snapshot()
+    if not rows:
+        st.info("No turns recorded yet in this process.")
+    else:
+        st.caption("Per stage and per tool, in milliseconds (percentiles estimated from histogram buckets).")
+        st.dataframe(
+            [{k: round(v, 2) if isinstance(v, float) else v for k, v in row.items()} for row in rows],
+            hide_index=True
+        )
+        counters = metrics.counters()
+        if counters:
+            st.json(counters)
+
+    col_export, col_reset = st.columns([3, 1])
+    with col_export:
+        st.download_button("Export Prometheus metrics", metrics.to_prometheus(), file_name="triad_metrics.prom",
+                           mime="text/plain")
+    with col_reset:
+        if st.button("Reset metrics"):
+            metrics.reset()
+            st.rerun()
+
+    st.subheader("Recent turns")
+    traces = list(metrics.recent_traces)[::-1]
+    if not traces:
+        st.caption("No traces yet.")
+    for trace in traces[:10]:
+        started = datetime.fromtimestamp(trace['started_at'], timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        with st.expander(f"{started} UTC — {trace['name']} {trace['total'] * 1000:.0f} ms"):
+            st.dataframe([
+                {"stage": span['stage'], "labels": ",".join(f"{k}={v}" for k, v in span['labels'].items()),
+                 "start_ms": round(span['start'] * 1000, 2), "duration_ms": round(span['duration'] * 1000, 2)}
+                for span in trace['spans']
+            ], hide_index=True)
+
+    st.subheader("Profiles")
+    st.caption("Captured on request: \"Profile my next message\" in the chat sidebar, or X-Profile: 1 on the HTTP server (--allow-profiling).")
+    for profile in list(metrics.recent_profiles)[::-1]:
+        started = datetime.fromtimestamp(profile['started_at'], timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        with st.expander(f"{started} UTC — {profile['label'][:60]!r} {profile['wall_seconds'] * 1000:.0f} ms, "
+                         f"peak {profile['peak_bytes'] / 1024:.0f} KB traced"):
+            st.code(profile['cpu'])
+            st.code("\n".join(profile['memory']))
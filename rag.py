@@ -0,0 +1,373 @@
+import hashlib
+import json
+import os
+import re
+import zlib
+import numpy as np
+
+# , Page 4: Evidence-Based Information Retrieval (RAG)
+#
+# Retrieval subsystem for CognitiveEngine.run_rag:
+#   corpus (knowledge_base/*.txt) -> chunks -> embeddings -> on-disk index
+# Vectors are saved as .npy files and memory-mapped on load, so a cold start
+# only re-embeds when the corpus or the embedder changes.
+
+CORPUS_DIR = "knowledge_base"
+INDEX_DIR = ".rag_index"
+IVF_THRESHOLD = 20_000  # Chunks above which the approximate IVF index is built.
+MIN_SCORE = 0.03  # Cosine similarity below which a passage is not considered relevant.
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# Function words carry no topical signal and only add noise to hashed features.
+STOPWORDS = frozenset(
+    "a about an and are as at be by can do does for from how i in is it me my of on or should "
+    "tell than that the this to was what when which who with you your".split()
+)
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN_RE.findall(text.casefold())
+
+
+def _light_stem(token: str) -> str:
+    # Folds simple plurals / 3rd person ('recommends' -> 'recommend').
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def chunk_text(text: str, max_words: int = 120, overlap: int = 20) -> list:
+    """
+    Splits a document into paragraph-aligned chunks of at most max_words.
+    Long paragraphs are split with a small word overlap so that no sentence
+    is lost at a chunk boundary.
+    """
+    chunks = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        words = paragraph.split()
+        if not words:
+            continue
+        step = max(max_words - overlap, 1)
+        for start in range(0, len(words), step):
+            chunks.append(" ".join(words[start:start + max_words]))
+            if start + max_words >= len(words):
+                break
+    return chunks
+
+
+def read_document(path: str) -> tuple:
+    """
+    Reads a corpus file. Leading 'Key: value' lines (e.g. 'Source: WHO
+    Guidelines, 2023') are metadata; the rest is the document body.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    meta = {}
+    while lines and re.match(r"^[A-Z][A-Za-z ]*: ", lines[0]):
+        key, value = lines.pop(0).split(": ", 1)
+        meta[key.strip().lower()] = value.strip()
+    return meta, "\n".join(lines)
+
+
+class HashingEmbedder:
+    """
+    Deterministic, offline embedder: signed feature hashing of unigrams and
+    bigrams with sublinear term frequency and (optional) IDF weighting,
+    L2-normalized. Needs nothing beyond NumPy.
+    Each n-gram is hashed into two buckets, so a single hash collision
+    between unrelated words only carries half of the n-gram's weight.
+    """
+    PROBES = (b"", b"#2")
+    def __init__(self, dim: int = 4096):
+        self.dim = dim
+        self.idf = None
+
+    @property
+    def name(self) -> str:
+        return f"hashing-{self.dim}"
+
+    def _features(self, text: str) -> dict:
+        tokens = [_light_stem(token) for token in tokenize(text) if token not in STOPWORDS]
+        grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        counts = {}
+        for gram in grams:
+            encoded = gram.encode("utf-8")
+            for probe in self.PROBES:
+                h = zlib.crc32(encoded + probe)
+                index = h % self.dim
+                sign = 1.0 if (h >> 31) & 1 == 0 else -1.0
+                counts[index] = counts.get(index, 0.0) + sign
+        return counts
+
+    def fit(self, texts: list):
+        """Learns IDF weights over the hashed feature space."""
+        df = np.zeros(self.dim, dtype=np.float32)
+        for text in texts:
+            df[list(self._features(text))] += 1.0
+        self.idf = np.log((1.0 + len(texts)) / (1.0 + df)).astype(np.float32) + 1.0
+        return self
+
+    def embed(self, texts: list) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            if features:
+                out[row, list(features)] = list(features.values())
+        # Sublinear term frequency, keeping the hash sign.
+        nonzero = out != 0
+        out[nonzero] = np.sign(out[nonzero]) * (1.0 + np.log(np.abs(out[nonzero])))
+        if self.idf is not None:
+            out *= self.idf
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+    def state(self) -> dict:
+        return {"idf": self.idf}
+
+    def load_state(self, state: dict):
+        self.idf = state.get("idf")
+
+
+class SentenceTransformerEmbedder:
+    """
+    Optional neural embedder (sentence-transformers). The package is only
+    imported when this embedder is actually used.
+    """
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    @property
+    def name(self) -> str:
+        return f"st-{self.model_name}"
+
+    def fit(self, texts: list):
+        return self
+
+    def embed(self, texts: list) -> np.ndarray:
+        return self.model.encode(texts, batch_size=64, normalize_embeddings=True,
+                                 convert_to_numpy=True).astype(np.float32)
+
+    def state(self) -> dict:
+        return {}
+
+    def load_state(self, state: dict):
+        pass
+
+
+def _top_k(scores: np.ndarray, k: int):
+    """Row-wise top-k (indices, scores), best first, for a 2-D score matrix."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        empty = np.zeros((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1)
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+
+class IVFIndex:
+    """
+    Approximate inverted-file index: k-means centroids partition the vectors,
+    and a query only scores the rows of its nprobe nearest partitions.
+    Row ids are grouped by partition (order + offsets), so each probe is a
+    contiguous slice of the id list.
+    """
+    def __init__(self, centroids, order, offsets, nprobe: int = 8):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, n_lists: int = None, iterations: int = 10, seed: int = 0):
+        n = vectors.shape[0]
+        n_lists = n_lists or max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(n, size=min(n, n_lists * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = sample[assign == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+        assign = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 8192):
+            assign[start:start + 8192] = np.argmax(vectors[start:start + 8192] @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.searchsorted(assign[order], np.arange(n_lists + 1))
+        return cls(centroids.astype(np.float32), order, offsets)
+
+    def search(self, vectors: np.ndarray, queries: np.ndarray, k: int):
+        probes = _top_k(queries @ self.centroids.T, self.nprobe)[0]
+        all_idx, all_scores = [], []
+        for q, lists in zip(queries, probes):
+            rows = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in lists])
+            rows.sort()  # Sequential reads from the memory map.
+            scores = vectors[rows] @ q
+            idx, top = _top_k(scores[None, :], k)
+            all_idx.append(rows[idx[0]])
+            all_scores.append(top[0])
+        return all_idx, all_scores
+
+
+class VectorIndex:
+    """
+    Persistent dense index: vectors.npy (memory-mapped), chunks.jsonl
+    (text + source per row) and manifest.json (embedder and corpus fingerprint).
+    """
+    def __init__(self, vectors, chunks, manifest, ivf=None):
+        self.vectors = vectors
+        self.chunks = chunks
+        self.manifest = manifest
+        self.ivf = ivf
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def version(self) -> str:
+        return self.manifest["fingerprint"]
+
+    @staticmethod
+    def corpus_fingerprint(corpus_dir: str, embedder) -> str:
+        digest = hashlib.sha256(embedder.name.encode("utf-8"))
+        for name in sorted(os.listdir(corpus_dir)) if os.path.isdir(corpus_dir) else []:
+            path = os.path.join(corpus_dir, name)
+            stat = os.stat(path)
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    @classmethod
+    def build(cls, corpus_dir: str, index_dir: str, embedder, batch_size: int = 1024,
+              ivf_threshold: int = IVF_THRESHOLD):
+        chunks = []
+        for name in sorted(os.listdir(corpus_dir)):
+            if not name.endswith(".txt"):
+                continue
+            meta, body = read_document(os.path.join(corpus_dir, name))
+            source = meta.get("source", name)
+            chunks.extend({"text": text, "source": source, "doc": name} for text in chunk_text(body))
+
+        texts = [chunk["text"] for chunk in chunks]
+        embedder.fit(texts)
+        os.makedirs(index_dir, exist_ok=True)
+        vectors = np.lib.format.open_memmap(
+            os.path.join(index_dir, "vectors.npy"), mode="w+", dtype=np.float32,
+            shape=(len(texts), embedder.dim))
+        for start in range(0, len(texts), batch_size):
+            vectors[start:start + batch_size] = embedder.embed(texts[start:start + batch_size])
+        vectors.flush()
+
+        with open(os.path.join(index_dir, "chunks.jsonl"), "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(json.dumps(chunk) + "\n")
+        state = embedder.state()
+        if state.get("idf") is not None:
+            np.save(os.path.join(index_dir, "idf.npy"), state["idf"])
+
+        ivf = None
+        if len(texts) >= ivf_threshold:
+            ivf = IVFIndex.train(vectors)
+            np.save(os.path.join(index_dir, "ivf_centroids.npy"), ivf.centroids)
+            np.save(os.path.join(index_dir, "ivf_order.npy"), ivf.order)
+            np.save(os.path.join(index_dir, "ivf_offsets.npy"), ivf.offsets)
+
+        manifest = {
+            "fingerprint": cls.corpus_fingerprint(corpus_dir, embedder),
+            "embedder": embedder.name,
+            "dim": embedder.dim,
+            "count": len(texts),
+            "ivf": ivf is not None,
+        }
+        # The manifest is written last: an index without one is never trusted.
+        with open(os.path.join(index_dir, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+        print(f"RAG index built: {len(texts)} chunks from {corpus_dir}.")
+        return cls.load(index_dir, embedder)
+
+    @classmethod
+    def load(cls, index_dir: str, embedder):
+        with open(os.path.join(index_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+        vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(index_dir, "chunks.jsonl"), encoding="utf-8") as f:
+            chunks = [json.loads(line) for line in f]
+        idf_path = os.path.join(index_dir, "idf.npy")
+        embedder.load_state({"idf": np.load(idf_path) if os.path.exists(idf_path) else None})
+        ivf = None
+        if manifest.get("ivf"):
+            ivf = IVFIndex(
+                np.load(os.path.join(index_dir, "ivf_centroids.npy")),
+                np.load(os.path.join(index_dir, "ivf_order.npy"), mmap_mode="r"),
+                np.load(os.path.join(index_dir, "ivf_offsets.npy")),
+            )
+        return cls(vectors, chunks, manifest, ivf)
+
+    @classmethod
+    def load_or_build(cls, corpus_dir: str = CORPUS_DIR, index_dir: str = INDEX_DIR, embedder=None):
+        """Loads the on-disk index, rebuilding it only if the corpus or embedder changed."""
+        embedder = embedder or HashingEmbedder()
+        fingerprint = cls.corpus_fingerprint(corpus_dir, embedder)
+        try:
+            with open(os.path.join(index_dir, "manifest.json")) as f:
+                if json.load(f).get("fingerprint") == fingerprint:
+                    return cls.load(index_dir, embedder)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return cls.build(corpus_dir, index_dir, embedder)
+
+    def search_vectors(self, queries: np.ndarray, k: int = 3, exact: bool = None, block_rows: int = 65536):
+        """
+        Batched top-k cosine search for an (m, dim) array of normalized query
+        vectors. Uses the IVF index when present unless exact=True; exact
+        search scans the memory map in blocks to bound memory.
+        """
+        if self.ivf is not None and not exact:
+            return self.ivf.search(self.vectors, queries, k)
+        best_idx = np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(self), block_rows):
+            scores = queries @ self.vectors[start:start + block_rows].T
+            idx, top = _top_k(scores, k)
+            best_idx, best_scores = _top_k_merge(best_idx, best_scores, idx + start, top, k)
+        return list(best_idx), list(best_scores)
+
+
+def _top_k_merge(idx_a, scores_a, idx_b, scores_b, k):
+    idx = np.concatenate([idx_a, idx_b], axis=1)
+    scores = np.concatenate([scores_a, scores_b], axis=1)
+    order, top = _top_k(scores, k)
+    return np.take_along_axis(idx, order, axis=1), top
+
+
+class Retriever:
+    """Text-in, passages-out front end used by the Cognitive Engine."""
+    def __init__(self, corpus_dir: str = CORPUS_DIR, index_dir: str = INDEX_DIR, embedder=None):
+        self.embedder = embedder or HashingEmbedder()
+        self.index = VectorIndex.load_or_build(corpus_dir, index_dir, self.embedder)
+
+    @property
+    def version(self) -> str:
+        return self.index.version
+
+    def search_batch(self, queries: list, k: int = 3, min_score: float = MIN_SCORE) -> list:
+        """Top-k passages per query, best first, dropping those below min_score."""
+        if not len(self.index):
+            return [[] for _ in queries]
+        idx, scores = self.index.search_vectors(self.embedder.embed(queries), k)
+        return [
+            [dict(self.index.chunks[i], score=float(s)) for i, s in zip(row_idx, row_scores) if s >= min_score]
+            for row_idx, row_scores in zip(idx, scores)
+        ]
+
+    def search(self, query: str, k: int = 3, min_score: float = MIN_SCORE) -> list:
+        return self.search_batch([query], k, min_score)[0]
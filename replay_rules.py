@@ -0,0 +1,202 @@
+import argparse
+import gzip
+import itertools
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# : Offline replay of historical traffic through the Ethical Engine.
+#
+# Streams a JSONL file (or stdin) and runs every query through
+# EthicalEngine.validate_response twice: once with the current rules
+# (baseline) and once with a candidate rules.json, e.g. one produced by the
+# Level 4 loop. Lines are sent in batches to a process pool; each worker
+# returns only aggregate counters, and at most a few batches are in flight,
+# so memory stays bounded however large the input is.
+#
+#   python replay_rules.py chat_logs.jsonl.gz --candidate rules.candidate.json --output report.json
+
+STATUSES = ("APPROVED", "APPROVED_OVERRIDE", "FLAGGED")
+QUERY_FIELDS = ("query", "user_query", "prompt", "message", "content", "body")
+DRAFT_FIELDS = ("draft_response", "flagged_ai_response", "response")
+LOW_CONFIDENCE = "(low confidence)"
+EXAMPLES_PER_TRANSITION = 3
+
+_engines = None # Per worker process: (baseline, candidate) EthicalEngine
+
+
+def _init_worker(baseline_path: str, candidate_path: str):
+    global _engines
+    from agent_architecture import EthicalEngine
+    _engines = (EthicalEngine(rules_file=baseline_path, record_hits=False),
+                EthicalEngine(rules_file=candidate_path, record_hits=False))
+
+
+def _first_field(record: dict, fields) -> str:
+    for field in fields:
+        value = record.get(field)
+        if isinstance(value, str):
+            return value
+    return None
+
+
+def _hit_key(validation: dict) -> str:
+    if validation["status"] == "APPROVED":
+        return None
+    return validation.get("rule_id") or LOW_CONFIDENCE
+
+
+def _keep_example(examples: list, example: dict):
+    if len(examples) < EXAMPLES_PER_TRANSITION and example not in examples:
+        examples.append(example)
+
+
+def replay_batch(lines: list, query_fields=QUERY_FIELDS, draft_fields=DRAFT_FIELDS) -> dict:
+    """Validates one batch of raw JSONL lines; returns aggregate counters only."""
+    baseline, candidate = _engines
+    result = {"records": 0, "skipped": 0, "baseline_hits": Counter(), "candidate_hits": Counter(),
+              "transitions": Counter(), "examples": {}}
+    for line in lines:
+        try:
+            record = json.loads(line)
+            query = _first_field(record, query_fields)
+        except (ValueError, AttributeError):
+            query = None
+        if query is None:
+            result["skipped"] += 1
+            continue
+        draft = _first_field(record, draft_fields) or ""
+        before = baseline.validate_response(user_query=query, draft_response=draft)
+        after = candidate.validate_response(user_query=query, draft_response=draft)
+        result["records"] += 1
+        for counter, validation in ((result["baseline_hits"], before), (result["candidate_hits"], after)):
+            key = _hit_key(validation)
+            if key is not None:
+                counter[key] += 1
+        transition = (before["status"], after["status"])
+        result["transitions"][transition] += 1
+        if transition[0] != transition[1] or _hit_key(before) != _hit_key(after):
+            example = {"query": query[:200], "baseline_rule": _hit_key(before), "candidate_rule": _hit_key(after)}
+            _keep_example(result["examples"].setdefault(transition, []), example)
+    return result
+
+
+def _merge(total: dict, part: dict):
+    total["records"] += part["records"]
+    total["skipped"] += part["skipped"]
+    for key in ("baseline_hits", "candidate_hits", "transitions"):
+        total[key].update(part[key])
+    for transition, examples in part["examples"].items():
+        kept = total["examples"].setdefault(transition, [])
+        for example in examples:
+            _keep_example(kept, example)
+
+
+def _open_input(path: str):
+    if path == "-":
+        return sys.stdin.buffer
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def iter_batches(stream, batch_size: int):
+    """Yields lists of non-blank raw lines, batch_size at a time."""
+    lines = (line for line in stream if line.strip())
+    while True:
+        batch = list(itertools.islice(lines, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def replay(input_path: str, baseline_path: str, candidate_path: str, workers: int = None,
+           batch_size: int = 2000) -> dict:
+    """Replays a JSONL file against both rule sets and returns the aggregated report."""
+    workers = workers or os.cpu_count() or 1
+    total = {"records": 0, "skipped": 0, "baseline_hits": Counter(), "candidate_hits": Counter(),
+             "transitions": Counter(), "examples": {}}
+    start = time.perf_counter()
+    with _open_input(input_path) as stream:
+        batches = iter_batches(stream, batch_size)
+        if workers == 1:
+            _init_worker(baseline_path, candidate_path)
+            for batch in batches:
+                _merge(total, replay_batch(batch))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(baseline_path, candidate_path)) as pool:
+                in_flight = set()
+                for batch in batches:
+                    if len(in_flight) >= workers * 2:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            _merge(total, future.result())
+                    in_flight.add(pool.submit(replay_batch, batch))
+                for future in in_flight:
+                    _merge(total, future.result())
+    elapsed = time.perf_counter() - start
+    total["elapsed_seconds"] = elapsed
+    total["records_per_second"] = total["records"] / elapsed if elapsed else 0.0
+    total["workers"] = workers
+    return total
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"Replayed {report['records']:,} records ({report['skipped']:,} skipped) in {report['elapsed_seconds']:.1f}s "
+        f"with {report['workers']} workers: {report['records_per_second']:,.0f} records/s",
+        "",
+        "Status transitions (rows: baseline, columns: candidate):",
+        " " * 18 + "".join(f"{status:>18}" for status in STATUSES),
+    ]
+    for before in STATUSES:
+        lines.append(f"{before:<18}" + "".join(f"{report['transitions'][(before, after)]:>18,}" for after in STATUSES))
+    lines += ["", f"{'Rule':<24}{'Baseline':>12}{'Candidate':>12}{'Change':>12}"]
+    rules = sorted(set(report["baseline_hits"]) | set(report["candidate_hits"]))
+    for rule in rules:
+        before, after = report["baseline_hits"][rule], report["candidate_hits"][rule]
+        lines.append(f"{rule:<24}{before:>12,}{after:>12,}{after - before:>+12,}")
+    for (before, after), examples in sorted(report["examples"].items()):
+        lines.append("")
+        lines.append(f"Examples {before} -> {after}:")
+        lines += [f"  [{e['baseline_rule']} -> {e['candidate_rule']}] {e['query']}" for e in examples]
+    return "\n".join(lines)
+
+
+def to_json(report: dict) -> dict:
+    return {
+        "records": report["records"],
+        "skipped": report["skipped"],
+        "elapsed_seconds": report["elapsed_seconds"],
+        "records_per_second": report["records_per_second"],
+        "workers": report["workers"],
+        "baseline_hits": dict(report["baseline_hits"]),
+        "candidate_hits": dict(report["candidate_hits"]),
+        "transitions": {f"{before}->{after}": count for (before, after), count in sorted(report["transitions"].items())},
+        "examples": {f"{before}->{after}": examples for (before, after), examples in sorted(report["examples"].items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay JSONL traffic against baseline and candidate rules.")
+    parser.add_argument("input", help="JSONL file (.gz allowed) or - for stdin.")
+    parser.add_argument("--candidate", required=True, help="Candidate rules file to evaluate.")
+    parser.add_argument("--baseline", default="rules.json", help="Current rules file (default: rules.json).")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--output", help="Also write the report as JSON to this path.")
+    args = parser.parse_args()
+
+    report = replay(args.input, args.baseline, args.candidate, args.workers, args.batch_size)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(to_json(report), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
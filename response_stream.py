@@ -0,0 +1,66 @@
+import re
+import time
+
+# : Incremental response delivery for the chat UI.
+#
+# Drafts (from tools or, in a real app, from the LLM's token stream) are
+# consumed as an iterator of text chunks. Each chunk is passed through the
+# Ethical Engine's rolling-window StreamGuard and released to the UI as soon
+# as it is known to be clean, so a disallowed span stops the stream early
+# instead of being checked only after the whole response exists.
+
+_CHUNK_RE = re.compile(r"\S+\s*|\s+")
+
+
+def iter_text_chunks(text: str, delay: float = 0.0):
+    """Yields a finished text word by word (with its trailing whitespace)."""
+    for match in _CHUNK_RE.finditer(text):
+        if delay:
+            time.sleep(delay)
+        yield match.group(0)
+
+
+class ResponseStream:
+    """
+    Iterable over the released chunks of one response. After iteration:
+      text           - everything released to the user
+      stopped_rule   - the rule that stopped the stream, or None
+      ttft_seconds   - time from started_at to the first released chunk
+      total_seconds  - time from started_at to the end of the stream
+    """
+    def __init__(self, chunks, guard=None, started_at: float = None):
+        self.chunks = chunks
+        self.guard = guard
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.parts = []
+        self.stopped_rule = None
+        self.ttft_seconds = None
+        self.total_seconds = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def _release(self, chunk: str) -> str:
+        if self.ttft_seconds is None:
+            self.ttft_seconds = time.perf_counter() - self.started_at
+        self.parts.append(chunk)
+        return chunk
+
+    def __iter__(self):
+        try:
+            for chunk in self.chunks:
+                safe = self.guard.feed(chunk) if self.guard is not None else chunk
+                if self.guard is not None and self.guard.rule is not None:
+                    self.stopped_rule = self.guard.rule
+                    return # Stop pulling from the source: the rest is never generated.
+                if safe:
+                    yield self._release(safe)
+            if self.guard is not None:
+                tail = self.guard.finish()
+                if self.guard.rule is not None:
+                    self.stopped_rule = self.guard.rule
+                elif tail:
+                    yield self._release(tail)
+        finally:
+            self.total_seconds = time.perf_counter() - self.started_at
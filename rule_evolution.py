@@ -0,0 +1,337 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from rule_matcher import RuleMatcher, normalize_text
+
+# , Page 18 / Page 31: Level 4 self-evolution - rule synthesis and compaction.
+#
+# A resolved case becomes at most one candidate rule, keyed on the query's
+# main content phrase (at least MIN_CONTENT_TOKENS words, matched on word
+# boundaries; queries too generic for that are left to the supervisor).
+# The candidate is checked against the existing rules before anything is added:
+#   - subsumed: an existing rule's pattern already occurs in the candidate
+#     (found with one Aho-Corasick scan of the candidate over all patterns);
+#   - generalized: the candidate occurs inside an evolved rule's pattern,
+#     which is replaced by the shorter candidate;
+#   - merged: a token inverted index finds evolved rules with a similar token
+#     set (Jaccard); the pair is replaced by their longest common phrase.
+# Generalizing or merging only happens when both rules give the same message
+# (or the caller allows it): a candidate with a different supervisor response
+# is added as its own rule, ahead of any broader evolved rule covering it, and
+# a candidate with the same pattern but a different message is a conflict
+# that leaves the rules unchanged.
+# The whole rule set is then compacted (exact duplicates, evolved rules
+# subsumed by other rules, evolved rules that have not fired within the
+# retirement window) and written atomically. Hand-written policy rules are
+# never changed or removed.
+
+EVOLVED_SOURCE = "level_4_evolution"
+RETIRE_AFTER_DAYS = float(os.environ.get("RULE_RETIRE_DAYS", "30"))
+MERGE_JACCARD = 0.5
+MAX_PATTERN_TOKENS = 4
+MIN_PATTERN_CHARS = 5
+MIN_CONTENT_TOKENS = 2 # Single words ("hello", "headache") are too generic to block on
+MAX_CASE_IDS = 20
+LATENCY_ITERATIONS = 300
+
+STOPWORDS = {
+    "a", "about", "after", "all", "am", "an", "and", "any", "are", "as", "at", "bad", "be", "been", "before",
+    "being", "best", "but", "by", "can", "could", "do", "does", "doing", "for", "from", "get", "give", "good",
+    "had", "has", "have", "how", "i", "i'm", "if", "in", "into", "is", "it", "its", "just", "know", "let",
+    "like", "me", "more", "my", "need", "of", "on", "or", "our", "please", "should", "so", "some", "tell",
+    "than", "that", "the", "their", "them", "then", "there", "these", "they", "this", "to", "too", "up", "us",
+    "very", "want", "was", "we", "what", "when", "where", "which", "who", "why", "will", "with", "would",
+    "you", "your",
+}
+LATENCY_QUERIES = [
+    "What does WHO recommend for hypertension and blood pressure control?",
+    "Can you tell me about healthy sleep habits for older adults?",
+    "What is my 10-year cardiovascular risk score given my vitals?",
+    "I have had a headache and mild fever for two days, what should I do?",
+]
+
+_TOKEN_RE = re.compile(r"[\w']+")
+_write_lock = threading.Lock()
+
+
+def tokens(text: str) -> list:
+    return _TOKEN_RE.findall(normalize_text(text))
+
+
+def key_phrase(query: str) -> str:
+    """
+    The query's main content phrase: the longest run of consecutive
+    non-stopword tokens (by characters), capped at MAX_PATTERN_TOKENS.
+    Returns None when nothing specific enough is left (fewer than
+    MIN_CONTENT_TOKENS content words or MIN_PATTERN_CHARS characters).
+    """
+    best, run = [], []
+    for token in tokens(query) + [""]:
+        if token and token not in STOPWORDS and not token.isdigit():
+            run.append(token)
+            continue
+        if sum(map(len, run)) > sum(map(len, best)):
+            best = run
+        run = []
+    best = best[:MAX_PATTERN_TOKENS]
+    phrase = " ".join(best)
+    return phrase if len(best) >= MIN_CONTENT_TOKENS and len(phrase) >= MIN_PATTERN_CHARS else None
+
+
+def is_evolvable(case: dict) -> bool:
+    """Cases flagged by an existing rule are already covered by it; the rest need a supervisor response."""
+    return not case.get("rule_id") and bool(case.get("supervisor_response"))
+
+
+def candidate_from_case(case: dict, now: str = None):
+    """
+    Candidate rule for a resolved case, or None. Low-confidence cases become a
+    whole-word "block" rule that answers future matching queries with the
+    supervisor's response.
+    """
+    if not is_evolvable(case):
+        return None
+    phrase = key_phrase(case.get("user_query") or "")
+    if phrase is None:
+        return None
+    return {
+        "id": f"rule_l4_{case['id'][:8]}",
+        "pattern": phrase,
+        "action": "block",
+        "message": case["supervisor_response"],
+        "word_boundary": True,
+        "source": EVOLVED_SOURCE,
+        "case_ids": [case["id"]],
+        "created_at": now or datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _note_cases(rule: dict, candidate: dict):
+    """Records which cases a rule came from (most recent MAX_CASE_IDS)."""
+    rule["case_ids"] = (rule.get("case_ids", []) + candidate.get("case_ids", []))[-MAX_CASE_IDS:]
+
+
+def _is_evolved(rule: dict) -> bool:
+    return rule.get("source") == EVOLVED_SOURCE
+
+
+def _contains_phrase(haystack: list, needle: list) -> bool:
+    """True when the token list `needle` occurs as a consecutive run in `haystack`."""
+    n = len(needle)
+    return n > 0 and any(haystack[i:i + n] == needle for i in range(len(haystack) - n + 1))
+
+
+def _same_message(rule: dict, candidate: dict) -> bool:
+    return normalize_text(rule.get("message") or "").strip() == normalize_text(candidate.get("message") or "").strip()
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def _common_phrase(a: list, b: list) -> list:
+    """Longest common run of consecutive tokens."""
+    best = (0, 0)
+    previous = [0] * (len(b) + 1)
+    for i in range(1, len(a) + 1):
+        current = [0] * (len(b) + 1)
+        for j in range(1, len(b) + 1):
+            if a[i - 1] == b[j - 1]:
+                current[j] = previous[j - 1] + 1
+                if current[j] > best[0]:
+                    best = (current[j], i)
+        previous = current
+    return a[best[1] - best[0]:best[1]]
+
+
+class TokenIndex:
+    """Inverted index from pattern tokens to rule positions, for similarity lookups."""
+    def __init__(self, rules: list):
+        self.rules = rules
+        self.token_sets = [set(tokens(rule.get("pattern", ""))) for rule in rules]
+        self.postings = {}
+        for position, token_set in enumerate(self.token_sets):
+            for token in token_set:
+                self.postings.setdefault(token, []).append(position)
+
+    def similar(self, pattern: str, threshold: float = MERGE_JACCARD) -> list:
+        """[(jaccard, position)] of rules sharing tokens with the pattern, best first."""
+        query = set(tokens(pattern))
+        positions = {p for token in query for p in self.postings.get(token, ())}
+        scored = [(_jaccard(query, self.token_sets[p]), p) for p in positions]
+        return sorted((s for s in scored if s[0] >= threshold), key=lambda s: (-s[0], s[1]))
+
+
+def integrate_candidate(rules: list, candidate: dict, allow_message_merge: bool = False) -> tuple:
+    """
+    Adds the candidate to the rule list unless an existing rule covers it.
+    Returns (rules, outcome) with outcome in added / subsumed / generalized /
+    merged / conflict. An evolved rule is only generalized or merged into when
+    it gives the same message as the candidate, or allow_message_merge is set.
+    """
+    pattern = normalize_text(candidate["pattern"])
+    pattern_tokens = tokens(pattern)
+    compatible = lambda rule: allow_message_merge or _same_message(rule, candidate)
+
+    # 1. Subsumed: some existing pattern already occurs inside the candidate.
+    covering = RuleMatcher(rules).find_all(pattern)
+    if covering:
+        rule = rules[covering[0]]
+        if not _is_evolved(rule) or rule.get("action") != candidate["action"] or compatible(rule):
+            if _is_evolved(rule):
+                _note_cases(rule, candidate)
+            return rules, "subsumed"
+        if tokens(rule["pattern"]) == pattern_tokens:
+            # Same phrase, different answer: keep the existing rule, the supervisor decides.
+            return rules, "conflict"
+        # A broader evolved rule with another message: the more specific answer goes first.
+        position = covering[0]
+        return rules[:position] + [candidate] + rules[position:], "added"
+
+    index = TokenIndex(rules)
+    for _, position in index.similar(pattern, threshold=0.0):
+        rule = rules[position]
+        if not _is_evolved(rule) or rule.get("action") != candidate["action"] or not compatible(rule):
+            continue
+        # 2. Generalized: the candidate occurs inside an evolved rule's pattern.
+        if _contains_phrase(tokens(rule["pattern"]), pattern_tokens):
+            rule["pattern"] = pattern
+            rule["word_boundary"] = True
+            _note_cases(rule, candidate)
+            return rules, "generalized"
+
+    # 3. Merged: a near-duplicate evolved rule is replaced by the common phrase of both.
+    for score, position in index.similar(pattern):
+        rule = rules[position]
+        if not _is_evolved(rule) or rule.get("action") != candidate["action"] or not compatible(rule):
+            continue
+        common = _common_phrase(tokens(rule["pattern"]), pattern_tokens)
+        if len(common) >= MIN_CONTENT_TOKENS and len(" ".join(common)) >= MIN_PATTERN_CHARS:
+            rule["pattern"] = " ".join(common)
+            rule["word_boundary"] = True
+            _note_cases(rule, candidate)
+            return rules, "merged"
+
+    return rules + [candidate], "added"
+
+
+def compact_rules(rules: list, hits: dict, now: datetime = None, retire_after_days: float = RETIRE_AFTER_DAYS) -> tuple:
+    """
+    Removes redundant and stale evolved rules. Returns (rules, removed) where
+    removed maps "duplicate" / "subsumed" / "retired" to lists of rule ids.
+    """
+    now = now or datetime.now(timezone.utc)
+    cutoff = (now - timedelta(days=retire_after_days)).isoformat()
+    removed = {"duplicate": [], "subsumed": [], "retired": []}
+
+    # Exact duplicates (same normalized pattern and action): keep the first.
+    seen, unique = set(), []
+    for rule in rules:
+        key = (normalize_text(str(rule.get("pattern", ""))), rule.get("action"), bool(rule.get("word_boundary")))
+        if key in seen and _is_evolved(rule):
+            removed["duplicate"].append(rule.get("id"))
+            continue
+        seen.add(key)
+        unique.append(rule)
+
+    # An evolved rule whose pattern contains another rule's pattern adds nothing when
+    # the shorter rule matches every query it would match (a whole-word rule only
+    # covers another whole-word rule) and always wins over it: an escalation, an
+    # earlier rule with the same action, or any rule giving the same message.
+    matcher = RuleMatcher(unique)
+    kept = []
+    for position, rule in enumerate(unique):
+        if _is_evolved(rule):
+            covering = [p for p in matcher.find_all(rule["pattern"])
+                        if p != position
+                        and (not unique[p].get("word_boundary") or rule.get("word_boundary"))
+                        and (unique[p].get("action") == "escalate"
+                             or (unique[p].get("action") == rule.get("action")
+                                 and (p < position or _same_message(unique[p], rule))))]
+            if covering:
+                removed["subsumed"].append(rule.get("id"))
+                continue
+        kept.append(rule)
+
+    # Retire evolved rules that have not fired (or been created) within the window.
+    active = []
+    for rule in kept:
+        if _is_evolved(rule):
+            last_seen = max((hits.get(rule.get("id")) or {}).get("last_hit") or "", rule.get("created_at") or "")
+            if last_seen and last_seen < cutoff:
+                removed["retired"].append(rule.get("id"))
+                continue
+        active.append(rule)
+    return active, removed
+
+
+def validation_latency_us(rules: list, queries: list = None, iterations: int = LATENCY_ITERATIONS) -> float:
+    """Mean per-query matching time (microseconds) for a rule list."""
+    queries = queries or LATENCY_QUERIES
+    matcher = RuleMatcher(rules)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for query in queries:
+            matcher.match(query)
+    return (time.perf_counter() - start) / (iterations * len(queries)) * 1e6
+
+
+def write_rules_atomic(rules: list, path: str):
+    """Writes to a temporary file in the same directory, then renames it over the old file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".rules.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(rules, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def evolve(case: dict, rules_file: str, hits: dict, now: datetime = None) -> dict:
+    """
+    Runs one evolution step for a resolved case: integrate its candidate
+    rule, compact the rule set and write it if anything changed. Returns a
+    report with the rule count and validation latency before and after.
+    """
+    now = now or datetime.now(timezone.utc)
+    with _write_lock:
+        try:
+            with open(rules_file, "r") as f:
+                before = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            before = []
+        rules = [dict(rule) for rule in before]
+
+        candidate = candidate_from_case(case, now.isoformat())
+        outcome = "none"
+        if candidate is not None:
+            rules, outcome = integrate_candidate(rules, candidate)
+        elif is_evolvable(case):
+            outcome = "rejected" # Query too generic for a rule; left to supervisor review
+        rules, removed = compact_rules(rules, hits, now)
+
+        changed = rules != before
+        if changed:
+            write_rules_atomic(rules, rules_file)
+
+    queries = LATENCY_QUERIES + ([case["user_query"]] if case.get("user_query") else [])
+    return {
+        "candidate": candidate["pattern"] if candidate else None,
+        "outcome": outcome,
+        "removed": removed,
+        "written": changed,
+        "rules_before": len(before),
+        "rules_after": len(rules),
+        "latency_before_us": round(validation_latency_us(before, queries), 2),
+        "latency_after_us": round(validation_latency_us(rules, queries), 2),
+    }
@@ -0,0 +1,172 @@
+import unicodedata
+
+# Compiled multi-pattern matcher for the Ethical Engine's rule list.
+#
+# Every rule pattern is inserted into a single Aho-Corasick automaton, so a
+# query is scanned exactly once no matter how many rules the Level 4 loop has
+# added. Matching is done on the Unicode case-folded (NFKC) form of both the
+# pattern and the query.
+
+ACTION_PRIORITY = {"escalate": 0, "block": 1}
+
+
+def normalize_text(text: str) -> str:
+    """Case-folds text so 'Diagnose', 'DIAGNOSE' and 'diagnose' match alike."""
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class RuleMatcher:
+    """
+    Aho-Corasick automaton built once from the rule list.
+
+    Rules keep their original substring semantics. A rule may set
+    "word_boundary": true to only match whole words/phrases.
+
+    Priority when several rules match the same query is deterministic:
+    1. "escalate" rules win over "block" rules (a safety escalation must
+       never be hidden behind a canned block message).
+    2. Within the same action, the rule that appears first in rules.json wins.
+    Rules with any other action are ignored, as before.
+    """
+    def __init__(self, rules: list):
+        self.rules = rules
+        # Trie nodes: goto transitions, failure links, and output rule indices.
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        self._lengths = []
+        self._word_boundary = []
+        for index, rule in enumerate(rules):
+            pattern = normalize_text(str(rule.get("pattern", "")))
+            self._lengths.append(len(pattern))
+            self._word_boundary.append(bool(rule.get("word_boundary", False)))
+            if not pattern or rule.get("action") not in ACTION_PRIORITY:
+                continue
+            self._insert(pattern, index)
+        self._build_failure_links()
+        self.max_pattern_length = max(self._lengths, default=0)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def _insert(self, pattern: str, index: int):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        self._out[node] = self._out[node] + (index,)
+
+    def _build_failure_links(self):
+        # Breadth-first so every node's failure target is finalized first.
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                if self._out[self._fail[child]]:
+                    self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find_all(self, text: str, final: bool = True, before: str = "") -> list:
+        """
+        Scans the text once and returns the indices of every matching rule,
+        sorted by priority (see class docstring).
+        With final=False the text is a prefix of a longer stream, so a
+        word-boundary match ending at the very end is not reported yet.
+        `before` is the character preceding the text when it is a window of a
+        longer stream, so a match at its start is not mistaken for a word start.
+        """
+        folded = normalize_text(text)
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        found = set()
+        node = 0
+        for pos, ch in enumerate(folded):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                for index in out[node]:
+                    if index in found:
+                        continue
+                    if self._word_boundary[index] and not self._at_boundary(folded, pos, index, final, before):
+                        continue
+                    found.add(index)
+        return sorted(found, key=self._priority)
+
+    def _at_boundary(self, folded: str, end: int, index: int, final: bool = True, before: str = "") -> bool:
+        start = end - self._lengths[index] + 1
+        left = folded[start - 1] if start > 0 else normalize_text(before)[-1:]
+        if left and _is_word_char(left):
+            return False
+        if end + 1 < len(folded):
+            return not _is_word_char(folded[end + 1])
+        return final
+
+    def _priority(self, index: int):
+        return (ACTION_PRIORITY[self.rules[index]["action"]], index)
+
+    def match(self, text: str, final: bool = True, before: str = ""):
+        """Returns the highest-priority matching rule, or None."""
+        found = self.find_all(text, final, before)
+        return self.rules[found[0]] if found else None
+
+
+class StreamGuard:
+    """
+    Rolling-window rule check for text that arrives in chunks.
+
+    The last max_pattern_length + 1 characters are held back until the text
+    that follows them is known, so a disallowed span is caught before any of
+    it is released. Each feed() only rescans that window plus the new chunk,
+    so checking a whole response stays linear in its length. The character
+    just before the rescanned window is kept too, so word-boundary rules see
+    the true left neighbour and the verdict equals matching the whole text.
+    """
+    def __init__(self, matcher: RuleMatcher):
+        self.matcher = matcher
+        self.window = matcher.max_pattern_length + 1
+        self._context = "" # Already released text (tail only), for matches spanning chunks.
+        self._before = "" # The released character just before _context.
+        self._pending = "" # Received but not yet released.
+        self.rule = None
+
+    def feed(self, chunk: str) -> str:
+        """Adds a chunk; returns the text that is now safe to release ('' once a rule hit)."""
+        if self.rule is not None:
+            return ""
+        self._pending += chunk
+        self.rule = self.matcher.match(self._context + self._pending, final=False, before=self._before)
+        if self.rule is not None:
+            return ""
+        cut = max(len(self._pending) - self.window, 0)
+        safe, self._pending = self._pending[:cut], self._pending[cut:]
+        released = self._before + self._context + safe
+        self._before, self._context = released[-self.window - 1:-self.window], released[-self.window:]
+        return safe
+
+    def finish(self) -> str:
+        """End of stream: returns the held-back remainder if it is clean."""
+        if self.rule is None:
+            self.rule = self.matcher.match(self._context + self._pending, final=True, before=self._before)
+        if self.rule is not None:
+            return ""
+        safe, self._pending = self._pending, ""
+        return safe
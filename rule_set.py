@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from rule_matcher import RuleMatcher
+
+# : Versioned, hot-reloadable rule set for the Ethical Engine.
+#
+# rules.json is parsed and compiled into a RuleMatcher once per version and
+# published as an immutable snapshot. Readers take the current snapshot in a
+# single attribute read, so a validation always sees one complete rule list
+# even while a reload is in progress. Changes are picked up by a stat() of
+# the file at most once per check interval, on the request path (no polling
+# thread); a file whose content did not change is never recompiled.
+#
+# The version is a hash of the file content, so every session and every
+# server worker reports the same version for the same rules.
+#
+# Rule hits are counted here at validation time and drained periodically
+# into the escalation store, where the Level 4 loop uses them to retire
+# rules that no longer fire (see rule_evolution.py).
+
+DEFAULT_CHECK_INTERVAL = float(os.environ.get("RULES_CHECK_INTERVAL", "1.0"))
+
+
+class RuleSnapshot:
+    """One compiled version of the rules. Never mutated after creation."""
+    __slots__ = ("version", "rules", "matcher", "loaded_at", "compile_seconds")
+
+    def __init__(self, version: str, rules: list, matcher: RuleMatcher, compile_seconds: float):
+        self.version = version
+        self.rules = rules
+        self.matcher = matcher
+        self.loaded_at = time.time()
+        self.compile_seconds = compile_seconds
+
+
+class RuleSet:
+    def __init__(self, path: str, check_interval: float = DEFAULT_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock() # Serializes reloads; readers never take it.
+        self._signature = None
+        self._next_check = 0.0
+        self._metrics = {"reloads": 0, "checks": 0, "errors": 0, "last_error": None,
+                         "last_reload_seconds": 0.0}
+        self._snapshot = RuleSnapshot("empty", [], RuleMatcher([]), 0.0)
+        self._hits = {} # rule_id -> [count, last_hit_iso], not yet drained
+        self._hits_lock = threading.Lock()
+        self.reload()
+
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def current(self) -> RuleSnapshot:
+        """The rules to validate with, reloaded first if the file changed."""
+        if time.monotonic() >= self._next_check:
+            self._maybe_reload()
+        return self._snapshot
+
+    def _maybe_reload(self):
+        # Only one thread checks per interval; the others keep the current snapshot.
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = time.monotonic() + self.check_interval
+            self._metrics["checks"] += 1
+            if self._stat_signature() != self._signature:
+                self._load()
+        finally:
+            self._lock.release()
+
+    def reload(self) -> RuleSnapshot:
+        """Re-reads the file now (e.g. right after the Level 4 loop wrote it)."""
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            self._load()
+        return self._snapshot
+
+    def _load(self):
+        start = time.perf_counter()
+        signature = self._stat_signature()
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            version = hashlib.sha256(data).hexdigest()[:12]
+            if version != self._snapshot.version:
+                rules = json.loads(data)
+                if not isinstance(rules, list):
+                    raise ValueError("rules file must contain a JSON list")
+                matcher = RuleMatcher(rules)
+                self._snapshot = RuleSnapshot(version, rules, matcher, time.perf_counter() - start)
+                self._metrics["reloads"] += 1
+                self._metrics["last_reload_seconds"] = self._snapshot.compile_seconds
+        except (OSError, ValueError) as e:
+            # Keep serving the last good version; the file is retried once it changes again.
+            self._metrics["errors"] += 1
+            self._metrics["last_error"] = str(e)
+            print(f"Warning: {self.path} could not be loaded ({e}). Keeping rules version {self._snapshot.version}.")
+        self._signature = signature
+
+    def record_hit(self, rule_id: str):
+        now = datetime.now(timezone.utc).isoformat()
+        with self._hits_lock:
+            entry = self._hits.get(rule_id)
+            if entry is None:
+                self._hits[rule_id] = [1, now]
+            else:
+                entry[0] += 1
+                entry[1] = now
+
+    def drain_hits(self) -> dict:
+        """Returns and resets the hits counted since the last drain: {rule_id: (count, last_hit)}."""
+        with self._hits_lock:
+            hits, self._hits = self._hits, {}
+        return {rule_id: tuple(entry) for rule_id, entry in hits.items()}
+
+    def metrics(self) -> dict:
+        snapshot = self._snapshot
+        return dict(self._metrics, version=snapshot.version, rule_count=len(snapshot.rules),
+                    loaded_at=snapshot.loaded_at, check_interval=self.check_interval,
+                    pending_hits=len(self._hits))
+
+
+_rule_sets = {}
+_rule_sets_lock = threading.Lock()
+
+def get_rule_set(path: str) -> RuleSet:
+    """Process-wide RuleSet per rules file, shared by every engine and session."""
+    key = os.path.abspath(path)
+    with _rule_sets_lock:
+        if key not in _rule_sets:
+            _rule_sets[key] = RuleSet(path)
+        return _rule_sets[key]
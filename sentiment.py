@@ -0,0 +1,134 @@
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+
+# , Page 5: Sentiment Analysis - distress detection for the Empathic Engine.
+#
+# A small linear model over hashed unigrams and bigrams. The default weights
+# come from a distress lexicon (logit units), so scores are deterministic and
+# need no training data; trained weights of the same shape can be passed in
+# instead. Negators ("not", "never", "no", ...) mark the next two words, so
+# "not scared" does not count as "scared" while "not okay" counts as distress.
+#
+# Scoring a batch is one gather + bincount over the hashed feature indices of
+# all messages, so thousands of stored messages are scored in a single call.
+
+HASH_DIM = 1 << 18
+HIGH_DISTRESS = 0.75
+ELEVATED = 0.60
+NEGATORS = {"not", "no", "never", "don't", "dont", "isn't", "isnt", "wasn't", "nothing", "without"}
+
+DISTRESS_LEXICON = {
+    # Acute distress
+    "terrified": 2.5, "suicidal": 3.0, "panic": 2.5, "panicking": 2.5, "hopeless": 2.5,
+    "desperate": 2.3, "can't breathe": 2.5, "cant breathe": 2.5, "to die": 2.5,
+    "kill myself": 3.0, "end it": 2.0, "self harm": 3.0,
+    # Fear and anxiety
+    "scared": 2.2, "afraid": 2.0, "anxious": 2.2, "frightened": 2.2, "depressed": 1.8, "freaking": 1.5,
+    "worried": 1.0, "nervous": 1.0, "stressed": 1.0, "upset": 1.0, "crying": 1.2, "alone": 0.8,
+    "lonely": 1.0, "overwhelmed": 1.2, "helpless": 1.5, "worse": 0.6, "getting worse": 1.0,
+    # Symptoms described with urgency
+    "pain": 0.5, "hurts": 0.6, "bleeding": 1.0, "emergency": 1.0, "help me": 1.0, "please help": 1.0,
+    "not_okay": 1.0, "not_ok": 1.0, "not_fine": 1.0, "not_good": 0.8,
+    # Calm / reassured
+    "thanks": -1.0, "thank": -1.0, "relieved": -1.2, "better": -0.6, "fine": -0.6, "okay": -0.4,
+    "great": -0.8, "good": -0.4, "happy": -1.0, "calm": -0.8, "curious": -0.6,
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+# Mobile keyboards type "can’t" / "don’t" with typographic apostrophes.
+_APOSTROPHES = str.maketrans({"\u2019": "'", "\u2018": "'", "\u02bc": "'", "\uff07": "'"})
+
+
+@lru_cache(maxsize=200_000)
+def _feature_index(feature: str) -> int:
+    return zlib.crc32(feature.encode("utf-8")) % HASH_DIM
+
+
+def features(text: str) -> list:
+    """Unique hashed feature indices of a message: unigrams (negation-marked) and bigrams."""
+    tokens = _TOKEN_RE.findall(text.translate(_APOSTROPHES).casefold())
+    grams = set()
+    negate = 0
+    for i, token in enumerate(tokens):
+        if token in NEGATORS:
+            negate = 2
+            grams.add(token)
+        elif negate:
+            grams.add("not_" + token)
+            negate -= 1
+        else:
+            grams.add(token)
+        if i:
+            grams.add(tokens[i - 1] + " " + token)
+    return [_feature_index(gram) for gram in grams]
+
+
+def distress_status(score: float) -> str:
+    if score >= HIGH_DISTRESS:
+        return "High Distress"
+    if score >= ELEVATED:
+        return "Elevated"
+    return "Neutral"
+
+
+class DistressModel:
+    """Hashed n-gram logistic model; score() returns P(distress) per message."""
+    version = "lexicon-distress-v1"
+
+    def __init__(self, weights: np.ndarray = None, bias: float = 0.0):
+        if weights is None:
+            weights = np.zeros(HASH_DIM, dtype=np.float32)
+            for gram, weight in DISTRESS_LEXICON.items():
+                weights[_feature_index(gram)] = weight
+        self.weights = weights
+        self.bias = bias
+
+    def score(self, messages: list) -> np.ndarray:
+        n = len(messages)
+        per_message = [features(text) for text in messages]
+        counts = np.fromiter((len(f) for f in per_message), dtype=np.intp, count=n)
+        index = np.fromiter((i for f in per_message for i in f), dtype=np.intp, count=int(counts.sum()))
+        doc = np.repeat(np.arange(n), counts)
+        logits = self.bias + np.bincount(doc, weights=self.weights[index], minlength=n)
+        return 1.0 / (1.0 + np.exp(-logits))
+
+
+class DistressTracker:
+    """
+    Running distress estimate per session (exponentially weighted moving
+    average), updated with the newest message's score only, so a turn never
+    re-scores the history. The reported status uses the higher of the running
+    estimate and the newest message, so one acute message is not smoothed away.
+    """
+    def __init__(self, alpha: float = 0.5, max_sessions: int = 10_000):
+        self.alpha = alpha
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict() # session_id -> (ewma, peak, turns)
+        self._lock = threading.Lock()
+
+    def update(self, session_id: str, message_score: float) -> dict:
+        with self._lock:
+            previous = self._sessions.pop(session_id, None)
+            if previous is None:
+                ewma, peak, turns = message_score, message_score, 1
+            else:
+                ewma = self.alpha * message_score + (1.0 - self.alpha) * previous[0]
+                peak, turns = max(previous[1], message_score), previous[2] + 1
+            self._sessions[session_id] = (ewma, peak, turns)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return {
+            "status": distress_status(max(ewma, message_score)),
+            "score": round(float(ewma), 3),
+            "message_score": round(float(message_score), 3),
+            "peak": round(float(peak), 3),
+            "turns": turns,
+        }
+
+    def get(self, session_id: str):
+        with self._lock:
+            return self._sessions.get(session_id)
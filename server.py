@@ -0,0 +1,275 @@
+import argparse
+import base64
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import utils
+from agent_architecture import get_triad
+from metrics import metrics
+from model_registry import registry
+from orchestrator import get_orchestrator
+
+# : Headless HTTP/JSON entry point for the Triad pipeline.
+#
+# POST /v1/chat runs the same turn as the Streamlit app: orchestrated tool
+# calls -> draft -> validate_response -> output rule check -> escalation.
+# Engines, models and the tool cache are process-wide and shared by every
+# request. With --workers N the listening socket is bound once and the
+# process forks N workers after the models and rules are loaded, so the
+# read-only model state is shared copy-on-write (the RAG index is also
+# memory-mapped) and each worker serves requests on its own threads.
+#
+# Request:  {"query": "...", "session_id": "...", "vitals": {"age": 50, "bp": "145/92"},
+#            "history": [{"role": "user", "content": "..."}, ...], "images": ["<base64>", ...]}
+# Response: {"session_id", "status", "response", "reason", "rule_id", "escalation_id",
+#            "sentiment", "tool_errors", "timings"}
+#
+# GET /metrics returns this worker's stage histograms in the Prometheus text
+# format. With --allow-profiling, a request with "profile": true (or the
+# header X-Profile: 1) is run under cProfile/tracemalloc and the report is
+# added to its response as "profile".
+
+MAX_BODY_BYTES = 20 * 1024 * 1024
+METRICS_WRITE_SECONDS = 15
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def handle_chat(payload: dict) -> dict:
+    """Runs one full turn for a decoded request body."""
+    query = payload.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise BadRequest("'query' must be a non-empty string")
+    session_id = payload.get("session_id") or uuid.uuid4().hex
+    history = payload.get("history") or []
+    if not isinstance(history, list) or not all(
+        isinstance(m, dict) and isinstance(m.get("role"), str) and isinstance(m.get("content"), str) for m in history
+    ):
+        raise BadRequest("'history' must be a list of {\"role\": str, \"content\": str} messages")
+    try:
+        images = [base64.b64decode(image) for image in payload.get("images") or []]
+    except (TypeError, ValueError) as e:
+        raise BadRequest(f"'images' must be base64 strings: {e}")
+
+    ethical = get_triad(rules_file=utils.RULES_FILE)["ethical"]
+    with metrics.trace("turn"):
+        turn = get_orchestrator().run_turn_sync(query, payload.get("vitals") or {}, images=images or None,
+                                                session_id=session_id, context={"messages": history})
+        draft_response = turn["draft"]
+        validation = turn["validation"]
+
+        if validation["status"] == "APPROVED":
+            # Same output check the chat app applies while streaming
+            with metrics.span("output_check"):
+                guard = ethical.stream_guard()
+                guard.feed(draft_response)
+                guard.finish()
+            if guard.rule is not None:
+                validation = ethical.rule_verdict(guard.rule, subject="Draft response")
+        response = draft_response if validation["status"] == "APPROVED" else validation["message"]
+
+        escalation_id = None
+        if validation["status"] == "FLAGGED":
+            with metrics.span("escalation"):
+                escalation_id = utils.add_escalation(
+                    user_query=query,
+                    flagged_ai_response=draft_response,
+                    flag_reason=validation["reason"],
+                    conversation_history=history + [{"role": "user", "content": query}],
+                    rule_id=validation.get("rule_id"),
+                    session_id=session_id
+                )
+    metrics.increment("turns_total", status=validation["status"], channel="http")
+    return {
+        "session_id": session_id,
+        "status": validation["status"],
+        "response": response,
+        "reason": validation["reason"],
+        "rule_id": validation.get("rule_id"),
+        "escalation_id": escalation_id,
+        "sentiment": turn["sentiment"],
+        "tool_errors": turn["errors"],
+        "timings": turn["timings"],
+    }
+
+
+class TriadRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive: load generators reuse connections.
+    # Headers and body are separate writes; with Nagle on, a kept-alive
+    # connection waits on the client's delayed ACK (~40 ms) for the body.
+    disable_nagle_algorithm = True
+    server_version = "TriadServer/1.0"
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_text(self, status: int, text: str):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_text(200, metrics.to_prometheus())
+        elif self.path == "/healthz":
+            rules = get_triad(rules_file=utils.RULES_FILE)["ethical"].rule_set.metrics()
+            self._send_json(200, {"status": "ok", "pid": os.getpid(), "rules": rules, "models": registry.metrics()})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/v1/chat":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = self.headers.get("Content-Length", "0").strip()
+            if not (length.isascii() and length.isdigit()):
+                # The body's end is unknown, so the connection cannot be reused.
+                self.close_connection = True
+                raise BadRequest("Content-Length must be a non-negative integer")
+            length = int(length)
+            if length > MAX_BODY_BYTES:
+                self.close_connection = True
+                self._send_json(413, {"error": "request body too large"})
+                return
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(payload, dict):
+                raise BadRequest("request body must be a JSON object")
+            profile_requested = payload.get("profile") is True or self.headers.get("X-Profile") == "1"
+            with metrics.profile(profile_requested and self.server.allow_profiling, label=self.path) as profile:
+                body = handle_chat(payload)
+            if profile is not None:
+                body["profile"] = profile
+            self._send_json(200, body)
+        except (BadRequest, json.JSONDecodeError) as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            print(f"Error handling request: {e}")
+            self._send_json(500, {"error": "internal error"})
+
+    def log_message(self, format, *args):
+        if self.server.access_log:
+            super().log_message(format, *args)
+
+
+class TriadHTTPServer(ThreadingHTTPServer):
+    request_queue_size = 128
+    access_log = False
+    allow_profiling = False
+    metrics_file = None
+
+
+def start_metrics_writer(path: str):
+    """Rewrites this worker's metrics as a Prometheus text file every METRICS_WRITE_SECONDS."""
+    if "{pid}" in path:
+        path = path.format(pid=os.getpid())
+
+    def _loop():
+        while True:
+            time.sleep(METRICS_WRITE_SECONDS)
+            try:
+                metrics.write_prometheus(path)
+            except OSError as e:
+                print(f"Warning: could not write metrics to {path}: {e}")
+
+    threading.Thread(target=_loop, name="metrics-writer", daemon=True).start()
+
+
+def prepare():
+    """Loads rules, models and the escalation store once, before any fork."""
+    if not os.path.exists(utils.RULES_FILE):
+        sys.exit(f"{utils.RULES_FILE} not found; start the Streamlit app once or restore it.")
+    get_triad(rules_file=utils.RULES_FILE)
+    # Schema/migration run once here; SQLite connections are per thread, so the
+    # workers' request threads open their own.
+    utils.init_db()
+    registry.warm_up(background=False)
+
+
+def _exit_worker():
+    """Saves the worker's pending rule hits (os._exit skips atexit), then exits."""
+    get_triad(rules_file=utils.RULES_FILE)["ethical"].flush_hits()
+    os._exit(0)
+
+
+def serve(server: TriadHTTPServer, workers: int):
+    if workers <= 1 or not hasattr(os, "fork"):
+        print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]} (pid {os.getpid()})")
+        if server.metrics_file:
+            start_metrics_writer(server.metrics_file)
+        server.serve_forever()
+        return
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            # Worker: accept on the inherited listening socket until terminated.
+            signal.signal(signal.SIGTERM, lambda *_: _exit_worker())
+            if server.metrics_file:
+                start_metrics_writer(server.metrics_file)
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        children.append(pid)
+    print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]} with {workers} workers {children}")
+
+    def _stop(*_):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, lambda *_: _stop())
+    try:
+        for _ in children:
+            os.wait()
+    except KeyboardInterrupt:
+        _stop()
+    server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Triad pipeline over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (pre-forked; POSIX only).")
+    parser.add_argument("--access-log", action="store_true")
+    parser.add_argument("--allow-profiling", action="store_true",
+                        help="Honor per-request profiling (\"profile\": true or X-Profile: 1).")
+    parser.add_argument("--metrics-file", help="Write metrics in the Prometheus text format to this file "
+                        "periodically; use {pid} in the name to get one file per worker.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    prepare()
+    print(f"Engines and models ready in {time.perf_counter() - start:.2f}s.")
+    server = TriadHTTPServer((args.host, args.port), TriadRequestHandler)
+    server.access_log = args.access_log
+    server.allow_profiling = args.allow_profiling
+    server.metrics_file = args.metrics_file
+    if args.metrics_file and args.workers > 1 and "{pid}" not in args.metrics_file:
+        sys.exit("--metrics-file needs a {pid} placeholder when running several workers.")
+    serve(server, args.workers)
+
+
+if __name__ == "__main__":
+    main()
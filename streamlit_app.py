@@ -1,10 +1,15 @@
 import json
 import streamlit as st
-from PIL import Image
-from agent_architecture import CognitiveEngine, EmpathicEngine, EthicalEngine
+from agent_architecture import get_triad
+from conversation_state import ConversationState
+from metrics import metrics
+from orchestrator import get_orchestrator
+from model_registry import registry
+from response_stream import ResponseStream, iter_text_chunks
 import utils
 import time
 import os
+import uuid
 
 # --- Page Config ---
 st.set_page_config(
@@ -30,27 +35,44 @@ if not os.path.exists(utils.RULES_FILE):
 
 # --- Agent Initialization ---
 # : Initialize the Triad Engine
+# Engines and models are shared process-wide; models load lazily, and a
+# background warm-up loads them ahead of the first request that needs them.
 @st.cache_resource
 def load_agent():
-    return {
-        "cognitive": CognitiveEngine(),
-        "empathic": EmpathicEngine(),
-        "ethical": EthicalEngine(rules_file="rules.json")
-    }
+    agent = get_triad(rules_file=utils.RULES_FILE)
+    if os.environ.get("WARMUP_MODELS", "1") == "1":
+        registry.warm_up(background=True)
+    return agent
 
 agent = load_agent()
-cognitive_engine = agent["cognitive"]
-empathic_engine = agent["empathic"]
 ethical_engine = agent["ethical"]
+# Simulated network latency of the LLM call (skipped when every tool result was cached)
+orchestrator = get_orchestrator(simulated_llm_latency=0.5)
 
 # --- Session State ---
 # , Page 5: Maintain dialogue state
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+# Only a fixed window of recent turns is kept in memory (plus a rolling
+# summary and key facts); older turns are stored and paged in on demand.
+if "conversation" not in st.session_state:
+    st.session_state.conversation = ConversationState(st.session_state.session_id)
+if "earlier_turns_shown" not in st.session_state:
+    st.session_state.earlier_turns_shown = 0
 if "vitals" not in st.session_state:
     st.session_state.vitals = {}
-if "image_bytes" not in st.session_state:
-    st.session_state.image_bytes = None
+# Only the latest time to first token; the distribution is in metrics ("ttft")
+if "last_ttft_seconds" not in st.session_state:
+    st.session_state.last_ttft_seconds = None
+# Uploaded images are kept only as a compact preprocessed uint8 batch
+# (224x224x3 per image) plus content hashes, never as the raw upload bytes.
+if "image_batch" not in st.session_state:
+    st.session_state.image_batch = None
+if "image_hashes" not in st.session_state:
+    st.session_state.image_hashes = []
+# One-shot cProfile/tracemalloc capture of the next turn (see metrics.py)
+if "profile_next_turn" not in st.session_state:
+    st.session_state.profile_next_turn = False
 
 # --- UI Components ---
 st.title("🤖 Human-AI Coordinated Healthcare Chatbot")
@@ -65,92 +87,142 @@ with st.sidebar:
     st.session_state.vitals["bp"] = st.text_input("Blood Pressure (e.g., 120/80)", value="145/92", key="bp_input")
     
     st.header("🔬 Image Analysis")
-    uploaded_image = st.file_uploader("Upload a medical image (e.g., skin lesion)", type=["jpg", "png", "jpeg"], key="image_uploader")
-    if uploaded_image:
-        st.session_state.image_bytes = uploaded_image.getvalue()
-        st.image(st.session_state.image_bytes, caption="Image ready for analysis.", use_column_width=True)
+    uploaded_images = st.file_uploader("Upload medical images (e.g., skin lesion)", type=["jpg", "png", "jpeg"], accept_multiple_files=True, key="image_uploader")
+    if uploaded_images:
+        from image_pipeline import content_hash, preprocess_batch
+        uploads = [uploaded.getvalue() for uploaded in uploaded_images]
+        hashes = [content_hash(image) for image in uploads]
+        # Only decode when the set of uploads changes, not on every rerun.
+        if hashes != st.session_state.image_hashes:
+            batch, hashes, errors = preprocess_batch(uploads)
+            for uploaded, error in zip(uploaded_images, errors):
+                if error is not None:
+                    st.error(f"{uploaded.name}: {error}")
+            valid = [i for i, error in enumerate(errors) if error is None]
+            st.session_state.image_batch = batch[valid] if valid else None
+            st.session_state.image_hashes = hashes
+        del uploads
+        if st.session_state.image_batch is not None:
+            st.image(list(st.session_state.image_batch), caption=["Image ready for analysis."] * len(st.session_state.image_batch), use_column_width=True)
+    else:
+        # Removed from the uploader: uploading the same file again must preprocess it again.
+        st.session_state.image_batch = None
+        st.session_state.image_hashes = []
+
+    with st.expander("💬 Conversation memory"):
+        st.json(st.session_state.conversation.stats())
+
+    with st.expander("⏱️ Profiling"):
+        if st.button("Profile my next message"):
+            st.session_state.profile_next_turn = True
+        if st.session_state.profile_next_turn:
+            st.caption("The next message will be profiled (cProfile + tracemalloc). Results appear under the answer and on the dashboard's Metrics tab.")
 
 # --- Chat Interface ---
-# Display past messages
-for message in st.session_state.messages:
+conversation = st.session_state.conversation
+EARLIER_PAGE_SIZE = 20
+
+# Older turns are only fetched from the store when the user asks for them.
+if conversation.window_start > st.session_state.earlier_turns_shown:
+    if st.button("Show earlier messages"):
+        st.session_state.earlier_turns_shown = min(st.session_state.earlier_turns_shown + EARLIER_PAGE_SIZE, conversation.window_start)
+if st.session_state.earlier_turns_shown:
+    with st.expander("Earlier messages", expanded=True):
+        for message in conversation.load_earlier(st.session_state.earlier_turns_shown):
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
+
+# Display the recent window only
+for message in conversation.window:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
 if prompt := st.chat_input("Ask a health-related question..."):
     # 1. Add user message to state and display
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    conversation.add("user", prompt)
     with st.chat_message("user"):
         st.markdown(prompt)
 
     # 2. Prepare for agent response
-    with st.chat_message("assistant"):
+    turn_started_at = time.perf_counter()
+    profile_turn, st.session_state.profile_next_turn = st.session_state.profile_next_turn, False
+    # Every stage below is recorded as a span of this turn's trace (dashboard Metrics tab)
+    with metrics.profile(profile_turn, label=prompt) as profile, metrics.trace("turn"), st.chat_message("assistant"):
         message_placeholder = st.empty()
-        full_response_content = ""
         
         # --- (SIMULATED) LLM "THINK" STEP ---
         # This simulates the LLM call to get a draft response.
-        # In a real app, this would be a call to Gemini,
-        # using empathic_engine.get_system_prompt() and tools.
-        
-        # Mocking the tool-use logic based on query
-        time.sleep(0.5) # Simulate network latency
-        
-        draft_response = ""
-        
-        if st.session_state.image_bytes is not None:
-            # User uploaded an image, assume they want it analyzed
-            tool_result = cognitive_engine.run_image_analysis(st.session_state.image_bytes)
-            draft_response = f"I have analyzed the image you uploaded. {tool_result['content']} \n\n**Explanation:** {tool_result['explanation']}"
-            st.session_state.image_bytes = None # Clear image after use
-        
-        elif "risk" in prompt.lower() or "vitals" in prompt.lower() or "score" in prompt.lower():
-            tool_result = cognitive_engine.run_risk_prediction(st.session_state.vitals)
-            draft_response = f"{tool_result['content']} \n\n**Explanation:** {tool_result['explanation']}"
-        
-        elif "hypertension" in prompt.lower() or "blood pressure" in prompt.lower() or "who recommends" in prompt.lower():
-            tool_result = cognitive_engine.run_rag(prompt)
-            draft_response = f"According to my knowledge base: {tool_result['content']} (Source: {tool_result['source']})"
-        
-        else:
-            # Fallback response for general queries
-            draft_response = "I am a healthcare education bot. I can provide information on preventive health, analyze (mock) health data you provide, and analyze (mock) medical images you upload. Please ask about general health topics, risk assessments, or upload an image for analysis."
-        
-        # --- 3. ETHICAL ENGINE VALIDATION  ---
-        validation = ethical_engine.validate_response(
-            user_query=prompt,
-            draft_response=draft_response
-        )
-        
-        # --- 4. ACT & OBSERVE LOOP  ---
-        if validation["status"] == "APPROVED":
-            # Case 1: Response is safe. Deliver it.
-            final_message = draft_response
-            full_response_content = final_message
-            
-        elif validation["status"] == "APPROVED_OVERRIDE":
-            # Case 2: Rule-based block. Deliver the rule's canned message.
-            final_message = validation["message"]
-            full_response_content = final_message
-            
-        elif validation["status"] == "FLAGGED":
-            # Case 3: Escalation. Deliver canned message AND log for HITL.
+        # In a real app, this would be a call to Gemini with turn["prompt"]:
+        # the Empathic Engine's system prompt plus the session context
+        # (rolling summary, key facts, recent window) and the tools.
+        #
+        # The orchestrator routes the query to every tool it needs and runs them
+        # concurrently (per-tool timeouts, cancelled if the query itself is
+        # blocked/escalated). Each tool's part of the draft is streamed as soon
+        # as that tool finishes, instead of after the slowest one.
+        turn_stream = orchestrator.stream_turn(prompt, st.session_state.vitals, images=st.session_state.image_batch,
+                                               session_id=st.session_state.session_id, context=conversation.context())
+        # Clear images after use; uploads still in the uploader are preprocessed again for the next message
+        st.session_state.image_batch = None
+        st.session_state.image_hashes = []
+
+        # --- 3. ETHICAL ENGINE VALIDATION & 4. ACT & OBSERVE LOOP ---
+        # Case 1: The draft streams through the rolling-window ethical check, which
+        # stops the stream if a disallowed span appears.
+        sections = (chunk for section in turn_stream for chunk in iter_text_chunks(section))
+        stream = ResponseStream(sections, guard=ethical_engine.stream_guard(), started_at=turn_started_at)
+
+        # Chunks are appended to the UI as they are released (no full re-render per word)
+        with message_placeholder.container(), metrics.span("stream"):
+            st.write_stream(stream)
+            turn_stream.close() # Cancels tool calls still running if the guard stopped the stream
+            turn = turn_stream.turn
+            validation = turn["validation"]
+            if stream.stopped_rule is None and validation["status"] != "APPROVED":
+                # Case 2 (APPROVED_OVERRIDE): Rule-based block. Deliver the rule's canned message.
+                # Case 3 (FLAGGED): Escalation. Deliver canned message AND log for HITL (below).
+                # (Nothing of the draft was streamed in either case.)
+                stream = ResponseStream(iter_text_chunks(validation["message"]), started_at=turn_started_at)
+                st.write_stream(stream)
+        draft_response = turn["draft"]
+        for tool, error in turn["errors"].items():
+            if error != "cancelled":
+                st.warning(f"The {tool} tool did not respond ({error}); answering without it.")
+
+        if stream.stopped_rule is not None:
+            # The draft itself tripped a rule mid-stream: replace what was shown.
+            validation = ethical_engine.rule_verdict(stream.stopped_rule, subject="Draft response")
             final_message = validation["message"]
-            full_response_content = final_message
-            
-            # Log for supervisor review
-            utils.add_escalation(
-                user_query=prompt,
-                flagged_ai_response=draft_response,
-                flag_reason=validation["reason"],
-                conversation_history=st.session_state.messages # Log current full history
-            )
-        
-        # Simulate streaming response
-        for chunk in full_response_content.split():
-            message_placeholder.markdown(full_response_content + "▌") # Show typing indicator
-            full_response_content = full_response_content.replace(chunk + " ", "", 1)
-            time.sleep(0.05)
-        message_placeholder.markdown(final_message) # Display full message
-        
+            message_placeholder.markdown(final_message)
+        else:
+            final_message = stream.text
+
+        conversation.update_facts(vitals=st.session_state.vitals, sentiment=turn["sentiment"], validation=validation, query=prompt)
+        if validation["status"] == "FLAGGED":
+            # Log for supervisor review. The transcript is stored by reference:
+            # the session's turns are written once and the case records the range.
+            with metrics.span("escalation"):
+                conversation.persist()
+                utils.add_escalation(
+                    user_query=prompt,
+                    flagged_ai_response=draft_response,
+                    flag_reason=validation["reason"],
+                    conversation_history=None,
+                    rule_id=validation.get("rule_id"),
+                    session_id=st.session_state.session_id
+                )
+        metrics.increment("turns_total", status=validation["status"], channel="chat")
+
+        # Time to first token: from receiving the prompt to the first released chunk
+        if stream.ttft_seconds is not None:
+            st.session_state.last_ttft_seconds = stream.ttft_seconds
+            metrics.observe("ttft", stream.ttft_seconds)
+            st.caption(f"⏱️ Time to first token: {stream.ttft_seconds * 1000:.0f} ms")
+
+    if profile is not None:
+        with st.expander(f"⏱️ Profile of this turn ({profile['wall_seconds'] * 1000:.0f} ms, peak {profile['peak_bytes'] / 1024:.0f} KB traced)"):
+            st.code(profile["cpu"])
+            st.code("\n".join(profile["memory"]))
+
     # 5. Add final agent message to state
-    st.session_state.messages.append({"role": "assistant", "content": final_message})
+    conversation.add("assistant", final_message)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The app's modules live in the repository root (there is no package), so
+# make them importable however pytest is invoked.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,79 @@
+import gc
+import os
+
+import pytest
+
+from conversation_state import ConversationState, purge_stale_scratch
+from escalation_store import SQLiteEscalationStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteEscalationStore(str(tmp_path / "escalations.db"))
+
+
+def _chat(state, turns, start=0):
+    for i in range(start, start + turns):
+        state.add("user" if i % 2 == 0 else "assistant", f"message {i}")
+
+
+def _contents(messages):
+    return [m["content"] for m in messages]
+
+
+def _scratch_files(directory):
+    return [name for name in os.listdir(directory) if name.startswith("conversation-")]
+
+
+def test_window_is_bounded_and_older_turns_page_back_in(store, tmp_path):
+    state = ConversationState("s1", window=6, store=store, scratch_dir=str(tmp_path))
+    _chat(state, 47)
+    assert _contents(state.window) == [f"message {i}" for i in range(41, 47)]
+    assert state.window_start == 41
+
+    earlier, before = [], state.window_start
+    while before > 0:
+        page = state.load_earlier(10, before=before)
+        earlier = page + earlier
+        before -= len(page)
+    assert _contents(earlier) == [f"message {i}" for i in range(41)]
+
+    context = state.context()
+    assert _contents(context["messages"]) == _contents(state.window)
+    assert context["summary"].startswith("Earlier in this conversation (41 messages")
+
+
+def test_transcript_reaches_the_escalation_store_only_on_persist(store, tmp_path):
+    state = ConversationState("s2", window=4, store=store, scratch_dir=str(tmp_path))
+    _chat(state, 30)
+    assert store.get_turn_count("s2") == 0
+    assert _scratch_files(tmp_path)
+
+    assert state.persist() == 30
+    assert _contents(store.get_turns("s2")) == [f"message {i}" for i in range(30)]
+    assert not _scratch_files(tmp_path)
+
+    # After an escalation, later turns go straight to the escalation store.
+    _chat(state, 20, start=30)
+    assert state.persist() == 50
+    assert _contents(store.get_turns("s2")) == [f"message {i}" for i in range(50)]
+    assert _contents(state.load_earlier(3)) == ["message 43", "message 44", "message 45"]
+
+
+def test_scratch_file_is_deleted_with_the_session(store, tmp_path):
+    state = ConversationState("s3", window=4, store=store, scratch_dir=str(tmp_path))
+    _chat(state, 30)
+    assert _scratch_files(tmp_path)
+    del state
+    gc.collect()
+    assert not _scratch_files(tmp_path)
+    assert store.get_turn_count("s3") == 0
+
+
+def test_stale_scratch_files_are_purged(tmp_path):
+    stale, fresh = tmp_path / "conversation-old.db", tmp_path / "conversation-new.db"
+    for path in (stale, fresh, tmp_path / "conversation-old.db-wal"):
+        path.write_bytes(b"")
+    os.utime(stale, (0, 0))
+    assert purge_stale_scratch(directory=str(tmp_path)) == 1
+    assert sorted(_scratch_files(tmp_path)) == ["conversation-new.db"]
@@ -0,0 +1,62 @@
+import pytest
+
+from escalation_store import SQLiteEscalationStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteEscalationStore(str(tmp_path / "escalations.db"))
+    for i in range(7):
+        store.add_escalation(
+            user_query=f"query {i}",
+            flagged_ai_response="draft",
+            flag_reason="Query matched escalation rule: 'chest pain'" if i % 2 else "low confidence",
+            conversation_history=[{"role": "user", "content": f"query {i}"}],
+            escalation_id=f"case-{i}",
+            timestamp=f"2024-01-0{i + 1}T00:00:00+00:00",
+            rule_id="r1" if i % 2 else None,
+        )
+    return store
+
+
+def _pages(store, **filters):
+    pages, cursor = [], None
+    while True:
+        page, cursor = store.query_escalations(limit=3, cursor=cursor, **filters)
+        pages.append([case["id"] for case in page])
+        if cursor is None:
+            return pages
+
+
+def test_keyset_pages_cover_every_case_once(store):
+    assert _pages(store) == [["case-6", "case-5", "case-4"], ["case-3", "case-2", "case-1"], ["case-0"]]
+    assert _pages(store, newest_first=False) == [["case-0", "case-1", "case-2"], ["case-3", "case-4", "case-5"],
+                                                 ["case-6"]]
+
+
+def test_pages_stay_stable_when_cases_are_added(store):
+    _, cursor = store.query_escalations(limit=3)
+    store.add_escalation("new", "draft", "low confidence", [], escalation_id="case-new")
+    page, _ = store.query_escalations(limit=3, cursor=cursor)
+    assert [case["id"] for case in page] == ["case-3", "case-2", "case-1"]
+
+
+def test_filters_and_summaries(store):
+    assert _pages(store, rule_id="r1") == [["case-5", "case-3", "case-1"]]
+    assert _pages(store, reason="chest pain", since="2024-01-03", until="2024-01-07") == [["case-5", "case-3"]]
+    page, _ = store.query_escalations(limit=1)
+    assert "conversation_history" not in page[0]
+    assert store.get_escalation("case-6")["conversation_history"] == [{"role": "user", "content": "query 6"}]
+
+
+def test_delta_query_returns_only_new_and_resolved_cases(store):
+    changes, version = store.get_changes(0)
+    assert len(changes) == 7
+    assert store.get_changes(version) == ([], version)
+
+    assert store.resolve_escalation("case-2", "Handled.")
+    assert not store.resolve_escalation("case-2", "Again.")
+    store.add_escalation("another", "draft", "low confidence", [], escalation_id="case-7")
+    changes, latest = store.get_changes(version)
+    assert [(case["id"], case["status"]) for case in changes] == [("case-2", "RESOLVED"), ("case-7", "PENDING")]
+    assert latest > version and store.get_changes(latest) == ([], latest)
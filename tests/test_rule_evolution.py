@@ -0,0 +1,67 @@
+from datetime import datetime, timezone
+
+from rule_evolution import candidate_from_case, compact_rules, evolve, integrate_candidate
+from rule_matcher import RuleMatcher
+
+
+def _case(case_id, query, response):
+    return {"id": case_id * 4, "user_query": query, "supervisor_response": response}
+
+
+def _evolve_all(cases):
+    rules, outcomes = [], []
+    for case in cases:
+        candidate = candidate_from_case(_case(*case))
+        if candidate is None:
+            outcomes.append(None)
+            continue
+        rules, outcome = integrate_candidate(rules, candidate)
+        outcomes.append(outcome)
+    rules, _ = compact_rules(rules, hits={}, now=datetime.now(timezone.utc))
+    return rules, outcomes
+
+
+def test_different_messages_are_not_generalized():
+    rules, outcomes = _evolve_all([
+        ("aa", "natural headache remedies", "For children, see a pediatrician."),
+        ("bb", "headache remedies", "Rest and hydrate; see a doctor if it persists."),
+    ])
+    assert outcomes == ["added", "added"]
+    matcher = RuleMatcher(rules)
+    assert matcher.match("natural headache remedies please")["message"] == "For children, see a pediatrician."
+    assert matcher.match("any headache remedies?")["message"] == "Rest and hydrate; see a doctor if it persists."
+
+
+def test_same_message_is_generalized():
+    rules, outcomes = _evolve_all([
+        ("aa", "natural headache remedies", "Rest and hydrate."),
+        ("bb", "headache remedies", "Rest and hydrate."),
+    ])
+    assert outcomes == ["added", "generalized"]
+    assert [(r["pattern"], r["message"]) for r in rules] == [("headache remedies", "Rest and hydrate.")]
+
+
+def test_same_pattern_different_message_is_a_conflict():
+    rules, outcomes = _evolve_all([
+        ("aa", "best headache remedies for children", "For children, see a pediatrician."),
+        ("bb", "headache remedies for pregnant women", "Ask your midwife first."),
+    ])
+    assert outcomes == ["added", "conflict"]
+    assert [r["message"] for r in rules] == ["For children, see a pediatrician."]
+
+
+def test_generic_queries_make_no_rule(tmp_path):
+    assert candidate_from_case(_case("aa", "hello there", "Hi!")) is None
+    assert candidate_from_case(_case("bb", "tell me about headache", "See a doctor.")) is None
+    rules_file = tmp_path / "rules.json"
+    rules_file.write_text("[]")
+    report = evolve(_case("cc", "hello there", "Hi!"), str(rules_file), hits={})
+    assert report["outcome"] == "rejected" and not report["written"]
+
+
+def test_evolved_rules_match_whole_words():
+    candidate = candidate_from_case(_case("aa", "what about hello kitty toys", "No."))
+    assert candidate["word_boundary"] is True
+    matcher = RuleMatcher([candidate])
+    assert matcher.match("i like hello kitty toys") is not None
+    assert matcher.match("othello kitty toys") is None
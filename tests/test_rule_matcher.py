@@ -0,0 +1,50 @@
+import random
+import re
+
+from rule_matcher import ACTION_PRIORITY, RuleMatcher, normalize_text
+
+
+def _naive_find_all(rules, text):
+    """Reference: the old one-rule-at-a-time substring scan, returning every hit by priority."""
+    folded = normalize_text(text)
+    found = []
+    for index, rule in enumerate(rules):
+        pattern = normalize_text(rule["pattern"])
+        if not pattern or rule["action"] not in ACTION_PRIORITY:
+            continue
+        if rule.get("word_boundary"):
+            hit = re.search(r"(?<!\w)" + re.escape(pattern) + r"(?!\w)", folded) is not None
+        else:
+            hit = pattern in folded
+        if hit:
+            found.append(index)
+    return sorted(found, key=lambda i: (ACTION_PRIORITY[rules[i]["action"]], i))
+
+
+def test_matches_naive_scan_on_random_rules():
+    rng = random.Random(1)
+    for _ in range(300):
+        rules = [{"id": str(i), "pattern": "".join(rng.choice("ab ") for _ in range(rng.randint(1, 4))),
+                  "action": rng.choice(["block", "escalate", "log"]), "message": str(i),
+                  "word_boundary": rng.random() < 0.5} for i in range(rng.randint(1, 12))]
+        matcher = RuleMatcher(rules)
+        for _ in range(20):
+            text = "".join(rng.choice("abAB .") for _ in range(rng.randint(0, 30)))
+            assert matcher.find_all(text) == _naive_find_all(rules, text), (rules, text)
+
+
+def test_escalate_wins_over_earlier_block_rule():
+    rules = [{"id": "b", "pattern": "dose", "action": "block", "message": "block"},
+             {"id": "e", "pattern": "overdose", "action": "escalate", "message": "escalate"}]
+    assert RuleMatcher(rules).match("What is an OVERDOSE?")["id"] == "e"
+    assert RuleMatcher(rules).match("what dose?")["id"] == "b"
+
+
+def test_word_boundary_rule_ignores_substrings():
+    rules = [{"id": "w", "pattern": "rx", "action": "block", "message": "", "word_boundary": True}]
+    matcher = RuleMatcher(rules)
+    assert matcher.match("my rx refill") is not None
+    assert matcher.match("proxy settings") is None
+    # Unfinished stream text: the match may still continue as a longer word.
+    assert matcher.match("my rx", final=False) is None
+    assert matcher.match("rx refill", before="p") is None
@@ -0,0 +1,61 @@
+import json
+import os
+
+from rule_set import RuleSet, get_rule_set
+
+
+def _write(path, rules):
+    path.write_text(json.dumps(rules))
+    # Make the change visible to the stat() check even within one mtime tick.
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+
+def _rule(pattern, action="block"):
+    return {"id": pattern, "pattern": pattern, "action": action, "message": pattern}
+
+
+def test_file_changes_are_picked_up_after_the_check_interval(tmp_path):
+    path = tmp_path / "rules.json"
+    _write(path, [_rule("diagnose")])
+    rules = RuleSet(str(path), check_interval=0)
+    first = rules.current()
+    assert first.matcher.match("please diagnose me")["id"] == "diagnose"
+
+    _write(path, [_rule("diagnose"), _rule("dosage")])
+    second = rules.current()
+    assert second.version != first.version and second.matcher.match("what dosage?")["id"] == "dosage"
+    # The old snapshot is never mutated, so a validation in flight keeps a consistent view.
+    assert first.matcher.match("what dosage?") is None and len(first.rules) == 1
+
+
+def test_unchanged_content_is_not_recompiled(tmp_path):
+    path = tmp_path / "rules.json"
+    _write(path, [_rule("diagnose")])
+    rules = RuleSet(str(path), check_interval=0)
+    snapshot = rules.current()
+    _write(path, [_rule("diagnose")]) # Touched, same content
+    assert rules.current() is snapshot
+    assert rules.metrics()["reloads"] == 1
+
+
+def test_a_broken_file_keeps_the_last_good_rules(tmp_path):
+    path = tmp_path / "rules.json"
+    _write(path, [_rule("diagnose")])
+    rules = RuleSet(str(path), check_interval=0)
+    version = rules.current().version
+    path.write_text("[{not json")
+    assert rules.reload().version == version
+    assert rules.metrics()["errors"] == 1
+    _write(path, [_rule("dosage")])
+    assert rules.current().matcher.match("dosage")["id"] == "dosage"
+
+
+def test_checks_are_rate_limited_and_rule_sets_are_shared(tmp_path):
+    path = tmp_path / "rules.json"
+    _write(path, [_rule("diagnose")])
+    rules = RuleSet(str(path), check_interval=3600)
+    _write(path, [_rule("dosage")])
+    assert rules.current().matcher.match("dosage") is None # Not checked again yet
+    assert rules.reload().matcher.match("dosage")["id"] == "dosage"
+    assert get_rule_set(str(path)) is get_rule_set(os.path.join(str(tmp_path), ".", "rules.json"))
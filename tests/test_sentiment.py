@@ -0,0 +1,18 @@
+from sentiment import DistressModel, distress_status
+
+model = DistressModel()
+
+
+def _score(text):
+    return float(model.score([text])[0])
+
+
+def test_curly_apostrophes_match_straight_ones():
+    assert _score("I can’t breathe") == _score("I can't breathe")
+    assert distress_status(_score("I can’t breathe")) == "High Distress"
+
+
+def test_curly_apostrophe_negators():
+    assert _score("I don’t feel scared") == _score("I don't feel scared")
+    assert distress_status(_score("I don’t feel scared")) == "Neutral"
+    assert _score("it isn’t okay") == _score("it isn't okay")
@@ -0,0 +1,41 @@
+import random
+
+from response_stream import ResponseStream, iter_text_chunks
+from rule_matcher import RuleMatcher, StreamGuard
+
+RULES = [
+    {"id": "r1", "pattern": "ache relief", "action": "block", "message": "m1", "word_boundary": True},
+    {"id": "r2", "pattern": "diagnose", "action": "block", "message": "m2"},
+    {"id": "r3", "pattern": "chest pain", "action": "escalate", "message": "m3", "word_boundary": True},
+    {"id": "r4", "pattern": "dose", "action": "block", "message": "m4", "word_boundary": True},
+]
+WORDS = ["head", "headache", "ache", "relief", "chest", "pain", "dose", "doses", "diagnose", "drink", "rest",
+         "for", "the", "a", "x", ",", "."]
+
+
+def _streamed(matcher, text, chunks):
+    stream = ResponseStream(iter(chunks), guard=StreamGuard(matcher))
+    released = "".join(stream)
+    return stream.stopped_rule, released
+
+
+def test_word_boundary_rule_does_not_fire_mid_word_when_streamed():
+    matcher = RuleMatcher(RULES)
+    text = "For headache relief, rest drink drink drink."
+    rule, released = _streamed(matcher, text, list(iter_text_chunks(text)))
+    assert matcher.match(text) is None
+    assert rule is None and released == text
+
+
+def test_streamed_verdict_matches_whole_text():
+    matcher = RuleMatcher(RULES)
+    rng = random.Random(7)
+    for _ in range(3000):
+        text = "".join(rng.choice(WORDS) + rng.choice(["", " ", " ", "  "]) for _ in range(rng.randint(1, 25)))
+        cuts = sorted(rng.sample(range(1, len(text)), min(rng.randint(0, 8), len(text) - 1))) if len(text) > 1 else []
+        chunks = [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+        rule, released = _streamed(matcher, text, chunks)
+        # The stream may stop on an earlier, lower-priority rule; whether it stops must agree.
+        assert (rule is None) == (matcher.match(text) is None), (text, chunks)
+        if rule is None:
+            assert released == text
@@ -0,0 +1,64 @@
+import pickle
+
+import tool_cache as tool_cache_module
+from tool_cache import MISSING, ToolCache, normalize_query, vitals_key
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def _size(value):
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(tool_cache_module, "time", clock)
+    cache = ToolCache(ttl_seconds=10)
+    cache.put("rag", "v1", "q", {"answer": 1})
+    clock.now += 9
+    assert cache.get("rag", "v1", "q") == {"answer": 1}
+    clock.now += 2
+    assert cache.get("rag", "v1", "q") is MISSING
+    assert cache.stats()["expirations"] == 1
+
+
+def test_least_recently_used_entry_is_evicted_at_the_byte_budget():
+    value = "x" * 100
+    cache = ToolCache(max_bytes=3 * _size(value))
+    for key in ("a", "b", "c"):
+        cache.put("rag", "v1", key, value)
+    cache.get("rag", "v1", "a") # "b" is now the least recently used
+    cache.put("rag", "v1", "d", value)
+    assert [cache.get("rag", "v1", key) is MISSING for key in "abcd"] == [False, True, False, False]
+    assert cache.stats()["evictions"] == 1 and cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_disk_tier_survives_a_restart_and_respects_versions(tmp_path):
+    path = str(tmp_path / "tool_cache.db")
+    ToolCache(disk_path=path).put("risk", "v1", (50.0, "120/80"), {"score": 0.1})
+
+    restarted = ToolCache(disk_path=path)
+    assert restarted.get("risk", "v1", (50.0, "120/80")) == {"score": 0.1}
+    assert restarted.stats()["disk_hits"] == 1
+    assert restarted.get("risk", "v1", (50.0, "120/80")) == {"score": 0.1}
+    assert restarted.stats()["memory_hits"] == 1
+
+    # A new model version purges the old entries from both tiers.
+    assert restarted.get("risk", "v2", (50.0, "120/80")) is MISSING
+    assert ToolCache(disk_path=path).get("risk", "v1", (50.0, "120/80")) is MISSING
+
+
+def test_cached_call_computes_once_per_normalized_input():
+    cache = ToolCache()
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+    assert cache.cached_call("rag", "v1", normalize_query("What does WHO recommend?"), compute) == (1, False)
+    assert cache.cached_call("rag", "v1", normalize_query("  what does who RECOMMEND "), compute) == (1, True)
+    assert vitals_key({"age": "50", "bp": "120 / 80"}) == vitals_key({"age": 50, "bp": "120/80"})
+    assert vitals_key({"age": "abc"}) == ("abc", "120/80")
@@ -0,0 +1,183 @@
+import hashlib
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# : Shared result cache for deterministic Cognitive Engine tool calls.
+#
+# Keys combine the tool name, the version of the model / index that produced
+# the result, and a normalized input (query text, vitals tuple or image content
+# hash). A new model or index version therefore never serves stale results,
+# and its old entries are purged the first time the new version is seen.
+#
+# Tier 1 is an in-memory LRU with TTL and a byte budget; tier 2 (optional) is a
+# SQLite file that survives restarts.
+
+MISSING = object()
+
+_PUNCT_RE = re.compile(r"[^\w\s/]", re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """'What does WHO recommend for Hypertension?' -> 'what does who recommend for hypertension'"""
+    return _SPACE_RE.sub(" ", _PUNCT_RE.sub(" ", text.casefold())).strip()
+
+
+def vitals_key(vitals: dict) -> tuple:
+    """
+    Cache key for a vitals dict. Never raises: the risk model defaults junk
+    values ("abc", None) itself, so they are keyed by their text instead.
+    """
+    bp = _SPACE_RE.sub("", str(vitals.get("bp", "120/80")))
+    age = vitals.get("age", 50)
+    try:
+        age = float(age)
+    except (TypeError, ValueError):
+        age = str(age).strip()
+    return (age, bp)
+
+
+class ToolCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 3600.0, disk_path: str = None):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self._entries = OrderedDict() # key -> (tool, expires_at, size, value)
+        self._versions = {} # tool -> current model/index version
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0,
+                       "evictions": 0, "expirations": 0, "invalidations": 0}
+        if disk_path:
+            self._disk().executescript(
+                "CREATE TABLE IF NOT EXISTS tool_cache ("
+                " key TEXT PRIMARY KEY, tool TEXT NOT NULL, version TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, value BLOB NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS idx_tool_cache_tool ON tool_cache (tool, version);"
+            )
+
+    def _disk(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(tool: str, version: str, key) -> str:
+        return hashlib.sha256(repr((tool, str(version), key)).encode("utf-8")).hexdigest()
+
+    def _check_version(self, tool: str, version: str):
+        """Purges a tool's entries the first time a new model/index version is seen."""
+        version = str(version)
+        with self._lock:
+            previous = self._versions.get(tool)
+            if previous == version:
+                return
+            self._versions[tool] = version
+            stale = [k for k, entry in self._entries.items() if entry[0] == tool]
+            for k in stale:
+                self._bytes -= self._entries.pop(k)[2]
+            self._stats["invalidations"] += len(stale)
+        if self.disk_path:
+            conn = self._disk()
+            with conn:
+                conn.execute("DELETE FROM tool_cache WHERE tool = ? AND version != ?", (tool, version))
+
+    def get(self, tool: str, version: str, key):
+        self._check_version(tool, version)
+        cache_key = self.make_key(tool, version, key)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(cache_key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    return entry[3]
+                self._bytes -= self._entries.pop(cache_key)[2]
+                self._stats["expirations"] += 1
+        if self.disk_path:
+            row = self._disk().execute(
+                "SELECT expires_at, value FROM tool_cache WHERE key = ?", (cache_key,)
+            ).fetchone()
+            if row is not None and row[0] > now:
+                value = pickle.loads(row[1])
+                self._store_memory(cache_key, tool, row[0], len(row[1]), value)
+                with self._lock:
+                    self._stats["hits"] += 1
+                    self._stats["disk_hits"] += 1
+                return value
+        with self._lock:
+            self._stats["misses"] += 1
+        return MISSING
+
+    def _store_memory(self, cache_key, tool, expires_at, size, value):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(cache_key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[cache_key] = (tool, expires_at, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+                self._stats["evictions"] += 1
+
+    def put(self, tool: str, version: str, key, value):
+        self._check_version(tool, version)
+        cache_key = self.make_key(tool, version, key)
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        expires_at = time.time() + self.ttl_seconds
+        self._store_memory(cache_key, tool, expires_at, len(blob), value)
+        if self.disk_path:
+            conn = self._disk()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO tool_cache (key, tool, version, expires_at, value) VALUES (?, ?, ?, ?, ?)",
+                    (cache_key, tool, str(version), expires_at, blob),
+                )
+
+    def cached_call(self, tool: str, version: str, key, compute) -> tuple:
+        """Returns (value, hit). On a miss, calls compute() and stores the result."""
+        value = self.get(tool, version, key)
+        if value is not MISSING:
+            return value, True
+        value = compute()
+        self.put(tool, version, key, value)
+        return value, False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk_path:
+            conn = self._disk()
+            with conn:
+                conn.execute("DELETE FROM tool_cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+# Process-wide cache shared by every session, configured from the environment.
+tool_cache = ToolCache(
+    max_bytes=int(float(os.environ.get("TOOL_CACHE_MAX_MB", "64")) * 1024 * 1024),
+    ttl_seconds=float(os.environ.get("TOOL_CACHE_TTL_SECONDS", "3600")),
+    disk_path=os.environ.get("TOOL_CACHE_DISK") or None,
+)
@@ -1,32 +1,91 @@
+import threading
+from escalation_store import SQLiteEscalationStore, migrate_legacy_json
+from metrics import metrics
 
-import json
-import os
-
-DB_NAME = "escalations.json"
+DB_NAME = "escalations.db"
+LEGACY_DB_NAME = "escalations.json"
 RULES_FILE = "rules.json"
 
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """Returns the process-wide escalation store, creating it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SQLiteEscalationStore(DB_NAME)
+            migrate_legacy_json(LEGACY_DB_NAME, _store)
+        return _store
+
 def init_db():
-    """Initialize a mock database for storing escalations."""
-    if not os.path.exists(DB_NAME):
-        with open(DB_NAME, "w") as f:
-            json.dump([], f, indent=2)
-
-def add_escalation(user_query, flagged_ai_response, flag_reason, conversation_history):
-    """Save escalated queries to the mock database (JSON file)."""
-    data = []
-    if os.path.exists(DB_NAME):
-        with open(DB_NAME, "r") as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                data = []
-
-    record = {
-        "user_query": user_query,
-        "flag_reason": flag_reason,
-        "flagged_ai_response": flagged_ai_response,
-        "conversation_history": conversation_history
-    }
-    data.append(record)
-    with open(DB_NAME, "w") as f:
-        json.dump(data, f, indent=2)
+    """Initialize the escalation database (and migrate a legacy escalations.json)."""
+    get_store()
+
+def add_escalation(user_query, flagged_ai_response, flag_reason, conversation_history, rule_id=None,
+                   session_id=None):
+    """
+    Save an escalated query to the escalation store. Returns the new case id.
+    Messages are stored once per session; the case only references its turn range.
+    Pass conversation_history=None when the session's turns are already stored.
+    """
+    return get_store().add_escalation(
+        user_query=user_query,
+        flagged_ai_response=flagged_ai_response,
+        flag_reason=flag_reason,
+        conversation_history=conversation_history,
+        rule_id=rule_id,
+        session_id=session_id
+    )
+
+def get_conversation(session_id, turn_start=0, turn_end=None):
+    """Rebuild (a slice of) a session's transcript from the message store."""
+    return get_store().get_turns(session_id, turn_start, turn_end)
+
+def get_escalations(status=None):
+    """Fetch escalations, optionally filtered by status ("PENDING" / "RESOLVED")."""
+    return get_store().get_escalations(status=status)
+
+def get_escalation(escalation_id):
+    """Fetch one full case, including its conversation history."""
+    return get_store().get_escalation(escalation_id)
+
+def query_escalations(status=None, limit=25, cursor=None, reason=None, rule_id=None,
+                      since=None, until=None, newest_first=True):
+    """Paged, filterable case summaries. Returns (summaries, next_cursor)."""
+    return get_store().query_escalations(
+        status=status, limit=limit, cursor=cursor, reason=reason, rule_id=rule_id,
+        since=since, until=until, newest_first=newest_first
+    )
+
+def get_escalation_changes(since_version=0):
+    """Summaries of cases added/changed since the last poll. Returns (changes, latest_version)."""
+    return get_store().get_changes(since_version)
+
+def get_escalations_version():
+    """Current change version of the store, used as the starting point for polling."""
+    return get_store().get_latest_version()
+
+def resolve_escalation(escalation_id, supervisor_response):
+    """Mark a case as resolved with the supervisor's corrective response."""
+    return get_store().resolve_escalation(escalation_id, supervisor_response)
+
+def level_4_evolution_loop(case):
+    """
+    , Page 31: "Cherish Human Feedback" - Level 4 self-evolution.
+    Turns a resolved case into (at most) one new rule, deduplicated and
+    generalized against the existing rules, compacts the rule set (retiring
+    rules that have not fired recently) and writes rules.json atomically.
+    Returns the compaction report (rule count and latency before/after).
+    """
+    from agent_architecture import get_triad
+    from rule_evolution import evolve
+
+    # Rule hits counted in this process so far must be visible to retirement.
+    get_triad(rules_file=RULES_FILE)["ethical"].flush_hits()
+    with metrics.span("rule_evolution"):
+        report = evolve(case, RULES_FILE, get_store().get_rule_hits())
+    print(f"Level 4 evolution: candidate {report['candidate']!r} {report['outcome']}; "
+          f"rules {report['rules_before']} -> {report['rules_after']}, "
+          f"validation {report['latency_before_us']}us -> {report['latency_after_us']}us.")
+    return report